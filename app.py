@@ -1,59 +1,101 @@
 import os
-import logging
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from logging_config import configure_logging
+from db_profiles import engine_options
+from ratelimit import DEFAULT_LIMITS
 
 class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
 
-# Create the app
+login_manager = LoginManager()
+login_manager.login_view = 'login'
+login_manager.login_message = 'Please log in to access this page.'
+login_manager.login_message_category = 'info'
+
+@login_manager.user_loader
+def load_user(user_id):
+    from models import User
+    return User.query.get(int(user_id))
+
+# Create the app. Importing this module never touches the database or the
+# filesystem: schema creation and upload directories are handled by
+# `flask init-db` / `flask migrate` (see cli.py) or once in the gunicorn
+# master (see gunicorn.conf.py).
 app = Flask(__name__)
+configure_logging(app)
 app.secret_key = os.environ.get("SESSION_SECRET")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1)
 
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///marketplace.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
+# Connections each worker opens during warm-up (see warmup.py)
+app.config['DB_WARM_CONNECTIONS'] = int(os.environ.get("DB_WARM_CONNECTIONS", "2"))
+
+# Optional read replica for read-only views (see replica.py)
+app.config['REPLICA_DATABASE_URL'] = os.environ.get("REPLICA_DATABASE_URL")
+app.config['REPLICA_MAX_LAG'] = float(os.environ.get("REPLICA_MAX_LAG", "5"))
+app.config['REPLICA_READ_YOUR_WRITES'] = float(os.environ.get("REPLICA_READ_YOUR_WRITES", "10"))
+app.config['REPLICA_CHECK_INTERVAL'] = float(os.environ.get("REPLICA_CHECK_INTERVAL", "5"))
+
+# Full-page cache for anonymous visitors
+app.config['PAGE_CACHE_ENABLED'] = os.environ.get("PAGE_CACHE_ENABLED", "1") == "1"
+app.config['PAGE_CACHE_MAX_AGE'] = int(os.environ.get("PAGE_CACHE_MAX_AGE", "60"))
+
+# Rate limits for expensive POSTs, as "capacity/period_seconds" (see ratelimit.py)
+app.config['RATE_LIMIT_ENABLED'] = os.environ.get("RATE_LIMIT_ENABLED", "1") == "1"
+app.config['RATE_LIMIT_STORAGE'] = os.environ.get("RATE_LIMIT_STORAGE")
+app.config['RATE_LIMITS'] = {
+    name: os.environ.get(f"RATE_LIMIT_{name.upper()}", default)
+    for name, default in DEFAULT_LIMITS.items()
+}
+
+# Settled orders older than this many days are moved to the archive tables
+app.config['ORDER_ARCHIVE_DAYS'] = int(os.environ.get("ORDER_ARCHIVE_DAYS", "180"))
+
+# Queued digest emails are sent by a background thread in each worker;
+# set 0 and run `flask send-digests` from cron to send them from one place
+app.config['DIGEST_FLUSH_INTERVAL'] = float(os.environ.get("DIGEST_FLUSH_INTERVAL", "10"))
+
+# Live admin order feed (see order_feed.py); streams end before the
+# gunicorn worker timeout and the browser reconnects
+app.config['ORDER_FEED_POLL_INTERVAL'] = float(os.environ.get("ORDER_FEED_POLL_INTERVAL", "1"))
+app.config['ORDER_FEED_MAX_SECONDS'] = float(os.environ.get("ORDER_FEED_MAX_SECONDS", "25"))
+
+# Request profiling (see profiler.py): admins opt in per request, and
+# PROFILE_SAMPLE_RATE profiles that fraction of all traffic
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+app.config['PROFILE_INTERVAL'] = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+app.config['PROFILE_KEEP'] = int(os.environ.get("PROFILE_KEEP", "200"))
+
+# Bulk product import (see product_import.py): local image paths in an
+# uploaded file are resolved inside this folder
+app.config['IMPORT_IMAGE_FOLDER'] = os.environ.get("IMPORT_IMAGE_FOLDER")
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get("IMPORT_BATCH_SIZE", "500"))
+app.config['IMPORT_IMAGE_WORKERS'] = int(os.environ.get("IMPORT_IMAGE_WORKERS", "2"))
+
+# Payment images within this many bits of dHash distance (at most 3)
+# are flagged as duplicates (see payment_checks.py)
+app.config['PAYMENT_HASH_MAX_DISTANCE'] = int(os.environ.get("PAYMENT_HASH_MAX_DISTANCE", "3"))
+
 # File upload configuration
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['PRODUCT_UPLOAD_FOLDER'] = 'uploads/products'
 app.config['PAYMENT_UPLOAD_FOLDER'] = 'uploads/payments'
 
-# Initialize extensions
+# Initialize extensions (engines connect lazily on first use)
+from replica import init_replica
+from profiler import init_profiler
+init_replica(app)
+init_profiler(app)
 db.init_app(app)
-login_manager = LoginManager()
 login_manager.init_app(app)
-login_manager.login_view = 'login'
-login_manager.login_message = 'Please log in to access this page.'
-login_manager.login_message_category = 'info'
-
-@login_manager.user_loader
-def load_user(user_id):
-    from models import User
-    return User.query.get(int(user_id))
-
-with app.app_context():
-    # Import models to ensure tables are created
-    import models
-    db.create_all()
-    
-    # Create upload directories
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    os.makedirs(app.config['PRODUCT_UPLOAD_FOLDER'], exist_ok=True)
-    os.makedirs(app.config['PAYMENT_UPLOAD_FOLDER'], exist_ok=True)
-    
-    logging.info("Database tables created and upload directories initialized")
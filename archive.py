@@ -0,0 +1,115 @@
+"""
+Order archival.
+
+Settled (non-pending) orders older than ``ORDER_ARCHIVE_DAYS`` are moved in
+batches from ``order``/``order_item`` to ``archived_order``/
+``archived_order_item``, keeping their ids, so the hot tables that every
+admin list, dashboard sum and status filter scans stay small.
+
+Customer order history, the admin user stats and the dashboard totals read
+both tables, so archived orders stay visible where history matters.
+
+    flask --app main archive-orders --days 180 --batch-size 500
+"""
+
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, insert, delete, func, case, literal, union_all, tuple_
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, PendingNotification
+from replica import read_session, fetch_all
+
+logger = logging.getLogger(__name__)
+
+def _shared_columns(source, target):
+    names = [c.name for c in target.__table__.columns if c.name in source.__table__.columns]
+    return names, [source.__table__.c[name] for name in names]
+
+def archive_orders(older_than_days, batch_size=500):
+    """Move settled orders older than the cutoff into the archive tables; returns the count"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    order_names, order_columns = _shared_columns(Order, ArchivedOrder)
+    item_names, item_columns = _shared_columns(OrderItem, ArchivedOrderItem)
+    
+    # Never archive the newest order: SQLite would hand its id out again
+    newest_id = db.session.scalar(select(func.max(Order.id)))
+    archived = 0
+    
+    while True:
+        ids = db.session.scalars(
+            select(Order.id)
+            .where(Order.created_at < cutoff, Order.status != 'pending', Order.id != newest_id)
+            .order_by(Order.id)
+            .limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        
+        db.session.execute(insert(ArchivedOrder.__table__).from_select(
+            order_names, select(*order_columns).where(Order.id.in_(ids))))
+        db.session.execute(insert(ArchivedOrderItem.__table__).from_select(
+            item_names, select(*item_columns).where(OrderItem.order_id.in_(ids))))
+        db.session.execute(delete(PendingNotification).where(PendingNotification.order_id.in_(ids)))
+        db.session.execute(delete(OrderItem).where(OrderItem.order_id.in_(ids)))
+        db.session.execute(delete(Order).where(Order.id.in_(ids)))
+        db.session.commit()
+        
+        archived += len(ids)
+        logger.info(f"Archived {len(ids)} orders (up to #{ids[-1]})")
+    
+    return archived
+
+def order_history_page(user_id, cursor=None, limit=20):
+    """
+    One keyset page of a customer's orders across the hot and archive
+    tables, newest first. ``cursor`` is a (created_at, id) position.
+    """
+    parts = []
+    for model, archived in ((Order, False), (ArchivedOrder, True)):
+        part = select(model.id, model.created_at, literal(archived).label('archived')) \
+            .where(model.user_id == user_id)
+        if cursor:
+            part = part.where(tuple_(model.created_at, model.id) < tuple_(*cursor))
+        parts.append(part.order_by(model.created_at.desc(), model.id.desc()).limit(limit).subquery().select())
+    
+    page = union_all(*parts).subquery()
+    rows = read_session().execute(
+        select(page).order_by(page.c.created_at.desc(), page.c.id.desc()).limit(limit)
+    ).all()
+    
+    hot_ids = [row.id for row in rows if not row.archived]
+    archived_ids = [row.id for row in rows if row.archived]
+    loaded = {}
+    if hot_ids:
+        loaded.update({(o.id, False): o for o in fetch_all(
+            select(Order).where(Order.id.in_(hot_ids)).options(
+                joinedload(Order.payment_method),
+                selectinload(Order.order_items).joinedload(OrderItem.product)))})
+    if archived_ids:
+        loaded.update({(o.id, True): o for o in fetch_all(
+            select(ArchivedOrder).where(ArchivedOrder.id.in_(archived_ids)).options(
+                joinedload(ArchivedOrder.payment_method),
+                selectinload(ArchivedOrder.order_items).joinedload(ArchivedOrderItem.product)))})
+    return [loaded[(row.id, row.archived)] for row in rows if (row.id, row.archived) in loaded]
+
+def user_order_stats(user_ids):
+    """
+    Order count, accepted spend and last order date per user across the hot
+    and archive tables, as ``{user_id: (count, total_spent, last_order_at)}``
+    """
+    parts = [
+        select(
+            model.user_id,
+            func.count(model.id).label('order_count'),
+            func.coalesce(func.sum(case((model.status == 'accepted', model.total_amount), else_=0)), 0).label('total_spent'),
+            func.max(model.created_at).label('last_order_at'),
+        ).where(model.user_id.in_(user_ids)).group_by(model.user_id)
+        for model in (Order, ArchivedOrder)
+    ]
+    both = union_all(*parts).subquery()
+    rows = read_session().execute(
+        select(both.c.user_id, func.sum(both.c.order_count), func.sum(both.c.total_spent), func.max(both.c.last_order_at))
+        .group_by(both.c.user_id)
+    ).all()
+    return {user_id: (count, total, last) for user_id, count, total, last in rows}
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Worker boot-time benchmark.
+
+Each sample starts a fresh interpreter, as a gunicorn worker without
+preloading would, and times how long it takes until the app is importable:
+
+- import only:        ``import main`` (what a worker pays now)
+- import + bootstrap: ``import main`` followed by the schema/upload-folder
+                      bootstrap that used to run at import time
+
+    python benchmarks/bench_boot.py [samples]
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def sample(code, samples):
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+if __name__ == '__main__':
+    samples = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    baseline = sample('import sys; sys.exit(0)', samples)
+    import_only = sample('import main', samples)
+    with_bootstrap = sample('import main, cli; cli.bootstrap()', samples)
+    print(f"Median of {samples} cold starts (interpreter start-up subtracted)")
+    print(f"- import + bootstrap (before): {(with_bootstrap - baseline) * 1000:7.1f} ms")
+    print(f"- import only (after):         {(import_only - baseline) * 1000:7.1f} ms")
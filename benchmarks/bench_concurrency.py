@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Concurrency benchmark against a running server.
+
+Start the server with the worker class to compare, then point this script
+at it:
+
+    GUNICORN_WORKER_CLASS=sync gunicorn -c gunicorn.conf.py main:app
+    GUNICORN_WORKER_CLASS=gthread GUNICORN_THREADS=8 gunicorn -c gunicorn.conf.py main:app
+
+    python benchmarks/bench_concurrency.py http://localhost:5000/ --clients 64 \\
+        --seconds 20 --pid <server master pid> [--cookie "session=..."]
+
+Reports throughput and latency percentiles plus the resident memory of the
+server process tree, so worker setups can be compared at the same memory budget.
+"""
+
+import argparse
+import os
+import threading
+import time
+import urllib.request
+
+def process_tree_rss(pid):
+    """Sum VmRSS (KiB) of a process and all of its children from /proc"""
+    total = 0
+    pids = [pid]
+    while pids:
+        current = pids.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+            with open(f'/proc/{current}/task/{current}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except FileNotFoundError:
+            continue
+    return total
+
+def worker(url, cookie, deadline, latencies, errors):
+    request = urllib.request.Request(url, headers={'Cookie': cookie} if cookie else {})
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors.append(1)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('url')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--pid', type=int, help='server master process id for memory usage')
+    parser.add_argument('--cookie', default=os.environ.get('BENCH_COOKIE'))
+    args = parser.parse_args()
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.seconds
+    threads = [threading.Thread(target=worker, args=(args.url, args.cookie, deadline, latencies, errors))
+               for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    count = len(latencies)
+    print(f"{args.url} with {args.clients} concurrent clients for {args.seconds:.0f}s")
+    print(f"- requests: {count} ok, {len(errors)} failed, {count / args.seconds:.0f} req/s")
+    if count:
+        print(f"- latency: p50 {latencies[count // 2] * 1000:.1f} ms, "
+              f"p99 {latencies[int(count * 0.99)] * 1000:.1f} ms")
+    if args.pid:
+        print(f"- server RSS: {process_tree_rss(args.pid) / 1024:.0f} MiB")
+
+if __name__ == '__main__':
+    main()
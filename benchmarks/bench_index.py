@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the anonymous landing page.
+
+Measures requests per second for GET / through the Flask test client with
+the full-page cache disabled and enabled:
+
+    python benchmarks/bench_index.py [requests]
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from main import app
+
+def run(requests, cache_enabled):
+    app.config['PAGE_CACHE_ENABLED'] = cache_enabled
+    client = app.test_client()
+    client.get('/')  # warm up templates and the cache
+
+    start = time.perf_counter()
+    for _ in range(requests):
+        response = client.get('/')
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - start
+    return requests / elapsed
+
+if __name__ == '__main__':
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    before = run(requests, cache_enabled=False)
+    after = run(requests, cache_enabled=True)
+    print(f"GET / (anonymous), {requests} requests")
+    print(f"- without page cache: {before:8.0f} req/s")
+    print(f"- with page cache:    {after:8.0f} req/s ({after / before:.1f}x)")
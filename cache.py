@@ -0,0 +1,137 @@
+import os
+import time
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+# Version counters live as files in the instance folder: a bump in one worker
+# is visible to every other worker through a single stat() call, without a
+# database round trip.
+VERSION_FOLDER = 'cache'
+
+def _version_path(name):
+    return os.path.join(current_app.instance_path, VERSION_FOLDER, f"{name}.version")
+
+def get_version(name):
+    """Return the current version token for a named cache"""
+    try:
+        return os.stat(_version_path(name)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def bump_version(name):
+    """
+    Invalidate every cache entry that depends on the named version
+    """
+    path = _version_path(name)
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Set the mtime explicitly so two bumps within one clock tick still differ
+        new_version = max(time.time_ns(), get_version(name) + 1)
+        with open(path, 'a'):
+            pass
+        os.utime(path, ns=(new_version, new_version))
+        logger.debug(f"Cache version bumped: {name}")
+    except OSError as e:
+        logger.error(f"Could not bump cache version {name}: {e}")
+
+class VersionedCache:
+    """
+    Per-worker key/value cache whose entries are dropped when any of the
+    versions they were stored under has been bumped. Holds at most
+    ``max_entries`` entries, evicting the least recently used.
+    """
+    def __init__(self, max_entries=1000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == versions:
+                self._entries.move_to_end(key)
+                return entry[1]
+        return None
+
+    def set(self, key, versions, value):
+        with self._lock:
+            self._entries[key] = (versions, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+page_cache = VersionedCache(max_entries=int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", "200")))
+data_cache = VersionedCache()
+
+def cached(key, version_names, loader):
+    """
+    Return ``loader()``'s result from the per-worker data cache, reloading
+    it once any of the named versions has been bumped
+    """
+    # Read the versions before loading so a bump during the load is not missed
+    versions = tuple(get_version(name) for name in version_names)
+    value = data_cache.get(key, versions)
+    if value is None:
+        value = loader()
+        data_cache.set(key, versions, value)
+    return value
+
+def cache_anonymous_page(*version_names, query_args=()):
+    """
+    Serve a GET view from an in-process full-page cache for anonymous visitors.
+
+    Entries are keyed by the path plus only the listed ``query_args``, so
+    arbitrary query strings cannot add entries, and are invalidated when any
+    of the given versions is bumped. Signed-in users, pending flash messages and
+    responses that set cookies always bypass the cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if (not current_app.config.get('PAGE_CACHE_ENABLED', True)
+                    or request.method != 'GET'
+                    or current_user.is_authenticated
+                    or '_flashes' in session):
+                response = make_response(view(*args, **kwargs))
+                response.headers.setdefault('Cache-Control', 'private, no-cache')
+                response.vary.add('Cookie')
+                return response
+
+            versions = tuple(get_version(name) for name in version_names)
+            key = request.path
+            if query_args:
+                key += '?' + '&'.join(f"{name}={request.args.get(name, '')}" for name in query_args)
+            cached = page_cache.get(key, versions)
+
+            if cached is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or 'Set-Cookie' in response.headers:
+                    return response
+                etag = hashlib.sha1(f"{key}:{versions}".encode()).hexdigest()
+                cached = (response.get_data(), response.content_type, etag)
+                page_cache.set(key, versions, cached)
+
+            body, content_type, etag = cached
+            response = make_response(body)
+            response.content_type = content_type
+            response.set_etag(etag)
+            response.cache_control.public = True
+            response.cache_control.max_age = current_app.config.get('PAGE_CACHE_MAX_AGE', 60)
+            response.vary.add('Cookie')
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
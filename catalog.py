@@ -0,0 +1,264 @@
+"""
+Cached catalog lookups shared by the storefront views.
+
+Results are kept per worker and invalidated through the 'catalog' and
+'payment_methods' versions, which the admin routes bump after every change.
+Cached objects are detached from their session, so relationships a template
+needs must be eager-loaded here.
+
+Each section also carries denormalized ``product_count`` and
+``in_stock_count`` columns so section navigation needs no aggregate query.
+Every route that adds, removes or restocks products adjusts them in the same
+transaction; ``flask reconcile-sections`` recomputes them from scratch.
+
+``suggestion_index()`` is a per-worker prefix index over product and section
+names for ``/api/suggest``, built from one narrow query and answering lookups
+from memory. After a catalog version bump the previous index keeps serving
+while a background thread rebuilds it, so no request waits for the rebuild.
+"""
+
+import re
+import heapq
+import logging
+import threading
+from bisect import bisect_left, bisect_right
+from operator import itemgetter
+from flask import current_app
+from sqlalchemy import select, update, func, case
+from sqlalchemy.orm import joinedload
+from app import db
+from cache import cached, bump_version, get_version
+from models import Product, PaymentMethod, Section
+from replica import read_session
+
+CATALOG_VERSION = 'catalog'
+PAYMENT_METHODS_VERSION = 'payment_methods'
+
+logger = logging.getLogger(__name__)
+
+# The worker's suggestion index, the catalog version it was built from, and
+# whether a background rebuild is running
+_suggestions = {'index': None, 'version': None, 'building': False}
+_suggestions_lock = threading.Lock()
+
+def _load_detached(stmt):
+    session = read_session()
+    objects = session.scalars(stmt).unique().all()
+    for obj in objects:
+        session.expunge(obj)
+    return objects
+
+def featured_products():
+    return cached('featured_products', (CATALOG_VERSION,), lambda: _load_detached(
+        select(Product).filter_by(is_featured=True).options(joinedload(Product.section))
+    ))
+
+def active_payment_methods():
+    return cached('active_payment_methods', (PAYMENT_METHODS_VERSION,), lambda: _load_detached(
+        select(PaymentMethod).filter_by(is_active=True)
+    ))
+
+def normalize_search_text(text):
+    return ' '.join(re.sub(r'[^\w]+', ' ', (text or '').lower()).split())
+
+def _rank(start, entry):
+    # Matches at the start of a name first, then earlier words, then shorter names
+    return (start, len(entry['name']), entry['name'], entry['id'])
+
+class _SuggestionTier:
+    """
+    One tier of ``(key, start, entry)`` items sorted by key, so the matches
+    for a prefix are one contiguous range found by binary search. Prefixes
+    matching more than ``BIG_RANGE`` keys also get their best-ranked entries
+    precomputed, so the short queries that match thousands of names are a
+    dictionary lookup rather than a ranking of the whole range.
+    """
+    
+    BIG_RANGE = 256
+    # Enough entries to fill MAX_LIMIT results after skipping up to
+    # MAX_LIMIT entries already returned by an earlier tier
+    MAX_LIMIT = 25
+    TOP = 2 * MAX_LIMIT
+    
+    def __init__(self, items):
+        items.sort(key=lambda item: (item[0], item[2]['id']))
+        self.keys = [item[0] for item in items]
+        self.refs = [(item[1], item[2]) for item in items]
+        self.top = {}
+        self._collect_top(0, len(self.keys), 0)
+    
+    def _ranked(self, lo, hi, limit, seen=()):
+        """Best-ranked ``(rank, entry)`` pairs in ``refs[lo:hi]``, one per entry"""
+        best = {}
+        for start, entry in self.refs[lo:hi]:
+            if id(entry) not in seen and (id(entry) not in best or start < best[id(entry)][0]):
+                best[id(entry)] = (start, entry)
+        return heapq.nsmallest(limit, ((_rank(start, entry), entry) for start, entry in best.values()),
+                               key=itemgetter(0))
+    
+    def _collect_top(self, lo, hi, length):
+        """
+        Best-ranked TOP pairs of ``keys[lo:hi]``, which share their first
+        ``length`` characters. Big ranges are split by the next character
+        and their children's lists merged, so each key is ranked only once.
+        """
+        if hi - lo <= self.BIG_RANGE:
+            return self._ranked(lo, hi, self.TOP)
+        prefix = self.keys[lo][:length]
+        parts = []
+        i = lo
+        while i < hi:
+            if len(self.keys[i]) == length:
+                # Keys equal to the prefix itself sort first
+                j = bisect_right(self.keys, prefix, i, hi)
+                parts.append(self._ranked(i, j, self.TOP))
+            else:
+                child = self.keys[i][:length + 1]
+                j = bisect_left(self.keys, child + '\U0010ffff', i, hi)
+                parts.append(self._collect_top(i, j, length + 1))
+            i = j
+        
+        merged = []
+        ids = set()
+        for rank, entry in heapq.merge(*parts, key=itemgetter(0)):
+            if id(entry) not in ids:
+                ids.add(id(entry))
+                merged.append((rank, entry))
+                if len(merged) == self.TOP:
+                    break
+        self.top[prefix] = [entry for _, entry in merged]
+        return merged
+    
+    def matches(self, query, limit, seen):
+        """Best-ranked ``limit`` entries matching ``query`` that are not in ``seen``"""
+        if limit <= 0:
+            return []
+        if query in self.top and limit <= self.MAX_LIMIT:
+            found = []
+            for entry in self.top[query]:
+                if id(entry) not in seen:
+                    found.append(entry)
+                    if len(found) == limit:
+                        break
+        else:
+            lo = bisect_left(self.keys, query)
+            hi = bisect_left(self.keys, query + '\U0010ffff', lo)
+            found = [entry for _, entry in self._ranked(lo, hi, limit, seen)]
+        seen.update(id(entry) for entry in found)
+        return found
+
+class SuggestionIndex:
+    """
+    Every word-suffix of every name ("free fire 520", "fire 520", "520") in
+    two tiers: whole-name prefixes, which always rank first, and the
+    suffixes starting at a later word. Sections and products are kept apart
+    so a few sections are never crowded out by thousands of products.
+    """
+    
+    def __init__(self, sections, products):
+        self.groups = [self._build(sections), self._build(products)]
+    
+    @staticmethod
+    def _build(entries):
+        tiers = ([], [])
+        for entry in entries:
+            words = normalize_search_text(entry['name']).split(' ')
+            for start in range(len(words)):
+                tiers[start > 0].append((' '.join(words[start:]), start, entry))
+        return [_SuggestionTier(items) for items in tiers]
+    
+    def search(self, query, limit=10):
+        query = normalize_search_text(query)
+        if not query:
+            return []
+        results = []
+        for tiers in self.groups:
+            seen = set()
+            for tier in tiers:
+                results.extend(tier.matches(query, limit - len(results), seen))
+        return results
+
+def _build_suggestion_index():
+    session = read_session()
+    sections = [{'type': 'section', 'id': section_id, 'name': name}
+                for section_id, name in session.execute(select(Section.id, Section.name))]
+    products = [{'type': 'product', 'id': product_id, 'name': name, 'section_id': section_id, 'section': section}
+                for product_id, name, section_id, section in session.execute(
+                    select(Product.id, Product.name, Product.section_id, Section.name).join(Section))]
+    return SuggestionIndex(sections, products)
+
+def _rebuild_suggestion_index(app, version):
+    with app.app_context():
+        try:
+            index = _build_suggestion_index()
+        except Exception as e:
+            logger.error(f"Could not rebuild the suggestion index: {e}")
+            index = None
+    with _suggestions_lock:
+        if index is not None:
+            _suggestions.update(index=index, version=version)
+        _suggestions['building'] = False
+
+def suggestion_index():
+    """
+    The worker's suggestion index. Only the first build happens in the
+    caller; once the catalog version moves, the current index is returned
+    while a background thread builds its replacement.
+    """
+    # Read the version before building so a bump during the build is not missed
+    version = get_version(CATALOG_VERSION)
+    with _suggestions_lock:
+        index = _suggestions['index']
+        if index is not None:
+            if _suggestions['version'] != version and not _suggestions['building']:
+                _suggestions['building'] = True
+                threading.Thread(
+                    target=_rebuild_suggestion_index, args=(current_app._get_current_object(), version),
+                    name='suggestion-index', daemon=True,
+                ).start()
+            return index
+    
+    index = _build_suggestion_index()
+    with _suggestions_lock:
+        if _suggestions['index'] is None:
+            _suggestions.update(index=index, version=version)
+    return index
+
+def catalog_changed():
+    bump_version(CATALOG_VERSION)
+
+def payment_methods_changed():
+    bump_version(PAYMENT_METHODS_VERSION)
+
+def adjust_section_counts(section_id, products=0, in_stock=0):
+    """Add to a section's counters inside the current transaction"""
+    if not products and not in_stock:
+        return
+    db.session.execute(
+        update(Section).where(Section.id == section_id).values(
+            product_count=Section.product_count + products,
+            in_stock_count=Section.in_stock_count + in_stock,
+        ),
+        execution_options={'synchronize_session': False}
+    )
+
+def reconcile_section_counts():
+    """
+    Recompute every section's counters from the product table. Returns the
+    number of sections whose stored counts were wrong.
+    """
+    product_count = select(func.count(Product.id)).where(
+        Product.section_id == Section.id).correlate(Section).scalar_subquery()
+    in_stock_count = select(func.coalesce(func.sum(case((Product.quantity > 0, 1), else_=0)), 0)).where(
+        Product.section_id == Section.id).correlate(Section).scalar_subquery()
+    
+    result = db.session.execute(
+        update(Section)
+        .where((Section.product_count != product_count) | (Section.in_stock_count != in_stock_count))
+        .values(product_count=product_count, in_stock_count=in_stock_count),
+        execution_options={'synchronize_session': False}
+    )
+    db.session.commit()
+    if result.rowcount:
+        catalog_changed()
+    return result.rowcount
@@ -0,0 +1,137 @@
+import os
+import logging
+import click
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+from app import app, db
+
+logger = logging.getLogger(__name__)
+
+def _index_names(connection, inspector, table_name):
+    names = {i['name'] for i in inspector.get_indexes(table_name)}
+    if connection.dialect.name == 'sqlite':
+        # SQLite reflection leaves out expression indexes such as lower(username)
+        names.update(connection.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"),
+            {'table': table_name}
+        ).scalars())
+    return names
+
+def migrate_schema():
+    """
+    Create missing tables, then add columns and indexes that were added to
+    the models after their table was created
+    """
+    import models  # noqa: F401  register all tables on the metadata
+
+    existing_tables = set(inspect(db.engine).get_table_names())
+    db.create_all()
+    inspector = inspect(db.engine)
+    changes = [f"table {table.name}" for table in db.metadata.sorted_tables
+               if table.name not in existing_tables]
+
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing_columns:
+                    column_ddl = CreateColumn(column).compile(dialect=db.engine.dialect)
+                    connection.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {column_ddl}'))
+                    changes.append(f"column {table.name}.{column.name}")
+
+            existing_indexes = _index_names(connection, inspector, table.name)
+            for index in table.indexes:
+                if index.name not in existing_indexes:
+                    index.create(connection)
+                    changes.append(f"index {index.name}")
+
+    return changes
+
+def create_upload_folders():
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['PRODUCT_UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['PAYMENT_UPLOAD_FOLDER'], exist_ok=True)
+
+def bootstrap():
+    """Bring the schema and upload directories up to date"""
+    with app.app_context():
+        changes = migrate_schema()
+        create_upload_folders()
+        if any(change.startswith('column section.') for change in changes):
+            # Counters added to an existing catalog start at zero
+            from catalog import reconcile_section_counts
+            reconcile_section_counts()
+    for change in changes:
+        logger.info(f"Schema updated: added {change}")
+    logging.info("Database tables created and upload directories initialized")
+    return changes
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create database tables and upload directories."""
+    bootstrap()
+    click.echo('Database initialized.')
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Add tables, columns and indexes missing from an existing database."""
+    changes = bootstrap()
+    for change in changes:
+        click.echo(f"Added {change}")
+    click.echo('Database is up to date.' if not changes else f'{len(changes)} change(s) applied.')
+
+@app.cli.command('send-digests')
+@click.option('--all', 'send_all', is_flag=True, help='Send every queued notification, due or not.')
+def send_digests_command(send_all):
+    """Send queued order notifications as per-recipient digests."""
+    from email_service import flush_due_notifications
+    sent = flush_due_notifications(force=send_all)
+    click.echo(f"{sent} email(s) sent.")
+
+@app.cli.command('archive-orders')
+@click.option('--days', type=int, default=None, help='Archive settled orders older than this (default ORDER_ARCHIVE_DAYS).')
+@click.option('--batch-size', type=int, default=500, show_default=True)
+def archive_orders_command(days, batch_size):
+    """Move old settled orders into the archive tables."""
+    from archive import archive_orders
+    days = days if days is not None else app.config['ORDER_ARCHIVE_DAYS']
+    archived = archive_orders(days, batch_size)
+    click.echo(f"{archived} order(s) archived.")
+
+@app.cli.command('reconcile-sections')
+def reconcile_sections_command():
+    """Recompute the denormalized per-section product counts."""
+    from catalog import reconcile_section_counts
+    fixed = reconcile_section_counts()
+    click.echo(f"{fixed} section(s) corrected.")
+
+@app.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None,
+              help='Input format (default: from the file extension).')
+@click.option('--images', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Folder that local image paths are relative to.')
+@click.option('--batch-size', type=int, default=None, help='Rows per batch (default IMPORT_BATCH_SIZE).')
+def import_products_command(path, fmt, images, batch_size):
+    """Upsert products from a CSV or JSONL file."""
+    from product_import import import_products, wait_for_images
+    fmt = fmt or ('jsonl' if path.lower().endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, 'rb') as f:
+        summary = import_products(app, f, fmt,
+                                  batch_size=batch_size or app.config['IMPORT_BATCH_SIZE'],
+                                  image_folder=images or app.config['IMPORT_IMAGE_FOLDER'])
+    for error in summary['errors']:
+        click.echo(f"line {error['line']}: {error['error']}", err=True)
+    if summary['images_queued']:
+        click.echo(f"Processing {summary['images_queued']} image(s)...")
+        wait_for_images()
+    click.echo(f"{summary['created']} created, {summary['updated']} updated, {summary['error_count']} error(s).")
+
+@app.cli.command('backfill-payment-hashes')
+def backfill_payment_hashes_command():
+    """Record normalized payment IDs and image hashes for older orders."""
+    from payment_checks import backfill_payment_hashes
+    updated = backfill_payment_hashes(app.config['PAYMENT_UPLOAD_FOLDER'])
+    click.echo(f"{updated} order(s) updated.")
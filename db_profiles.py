@@ -0,0 +1,120 @@
+"""
+Backend-aware engine options and connection pool metrics.
+
+SQLite files run in WAL mode with a busy timeout so concurrent gunicorn
+workers wait for the write lock instead of failing with "database is
+locked". PostgreSQL gets a sized pool and a server-side statement timeout.
+
+Environment:
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT   pool sizing (all backends)
+    DB_STATEMENT_TIMEOUT_MS                          PostgreSQL statement_timeout
+    SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE         SQLite pragmas
+"""
+
+import os
+import logging
+import sqlite3
+import threading
+import time
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+# Pool loggers are named after the pool class's module; keep them at the
+# WARNING default SQLAlchemy uses for its own 'sqlalchemy' logger tree
+logging.getLogger(f'{__name__}.TimedQueuePool').setLevel(logging.WARNING)
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long checkouts wait and how long connections are held"""
+
+    def _record(self, count_key, timing_key=None, value=0.0):
+        name = self.logging_name or 'default'
+        with _metrics_lock:
+            stats = _metrics.setdefault(name, {
+                'checkouts': 0, 'timeouts': 0, 'wait_total_ms': 0.0, 'wait_max_ms': 0.0,
+                'checkins': 0, 'hold_total_ms': 0.0, 'hold_max_ms': 0.0,
+            })
+            stats[count_key] += 1
+            if timing_key:
+                stats[f'{timing_key}_total_ms'] += value
+                stats[f'{timing_key}_max_ms'] = max(stats[f'{timing_key}_max_ms'], value)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            # Connect and authentication errors propagate without counting
+            self._record('timeouts')
+            raise
+        self._record('checkouts', 'wait', (time.perf_counter() - start) * 1000)
+        record.info['checked_out_at'] = time.perf_counter()
+        return record
+
+    def _do_return_conn(self, record):
+        checked_out_at = record.info.pop('checked_out_at', None)
+        if checked_out_at is not None:
+            self._record('checkins', 'hold', (time.perf_counter() - checked_out_at) * 1000)
+        super()._do_return_conn(record)
+
+def engine_options(url, name=None):
+    """Engine keyword arguments suited to the backend of ``url``"""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    pool = {
+        'poolclass': TimedQueuePool,
+        'pool_logging_name': name or 'default',
+        'pool_size': _env_int('DB_POOL_SIZE', 5),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 10),
+        'pool_timeout': _env_int('DB_POOL_TIMEOUT', 30),
+    }
+
+    if backend == 'sqlite':
+        if url.database in (None, '', ':memory:'):
+            return {}
+        # Pragmas are applied per connection in _sqlite_pragmas below
+        return pool
+
+    options = dict(pool, pool_recycle=300, pool_pre_ping=True)
+    if backend == 'postgresql':
+        statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS', 30000)
+        options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+    return options
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute(f"PRAGMA busy_timeout={_env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}")
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute(f"PRAGMA mmap_size={_env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}")
+    cursor.close()
+
+def pool_metrics(engines):
+    """Snapshot of pool usage and checkout wait times per engine (this worker only)"""
+    snapshot = {}
+    for bind, engine in engines.items():
+        name = bind or 'default'
+        pool = engine.pool
+        entry = {'pool': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            entry.update({
+                'size': pool.size(),
+                'checked_out': pool.checkedout(),
+                'checked_in': pool.checkedin(),
+                'overflow': pool.overflow(),
+            })
+        with _metrics_lock:
+            entry.update(_metrics.get(getattr(pool, 'logging_name', None) or name, {}))
+        if entry.get('checkouts'):
+            entry['wait_avg_ms'] = round(entry['wait_total_ms'] / entry['checkouts'], 3)
+        snapshot[name] = entry
+    return snapshot
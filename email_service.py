@@ -1,114 +1,293 @@
 import os
+import time
 import logging
-from datetime import datetime
-from models import SiteSettings
+import threading
+from datetime import datetime, timedelta
+from jinja2 import Environment
+from sqlalchemy import select, delete, func
+from sqlalchemy.orm import joinedload
+from app import db
+from models import SiteSettings, User, Order, OrderItem, PendingNotification
 
 logger = logging.getLogger(__name__)
 
-def send_email(to_email, subject, text_content=None, html_content=None):
+EMAIL_LOG_FILE = 'logs/emails.log'
+
+ORDER_ITEMS_TEMPLATE = """
+<ul>
+{% for item in order.order_items %}
+<li>{{ item.product.name }} x {{ item.quantity }} - ${{ '%.2f' % (item.price * item.quantity) }}{% if item.custom_input_value %} (Input: {{ item.custom_input_value }}){% endif %}</li>
+{% endfor %}
+</ul>
+"""
+
+# Compiled once at import; rendering is a plain function call per message
+_html_env = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
+_text_env = Environment()
+
+def _compile(subject, html):
+    return _text_env.from_string(subject), _html_env.from_string(html)
+
+EMAIL_TEMPLATES = {
+    'confirmation': _compile(
+        "Order Confirmation #{{ order.id }}",
+        """
+<h2>Order Confirmation</h2>
+<p>Dear {{ order.user.username }},</p>
+<p>Thank you for your order! We've received your payment confirmation and are reviewing it.</p>
+<p><strong>Order #:</strong> {{ order.id }}</p>
+<p><strong>Order Details:</strong></p>
+""" + ORDER_ITEMS_TEMPLATE + """
+<p><strong>Total Amount:</strong> ${{ '%.2f' % order.total_amount }}</p>
+<p><strong>Payment ID:</strong> {{ order.payment_id }}</p>
+<p>We'll review your payment confirmation and update you on the status soon.</p>
+""",
+    ),
+    'accepted': _compile(
+        "Order #{{ order.id }} Status Update - {{ order.status.title() }}",
+        """
+<h2>Great News! Your Order Has Been Accepted</h2>
+<p>Dear {{ order.user.username }},</p>
+<p>Your order #{{ order.id }} has been accepted and is being processed.</p>
+<p><strong>Order Details:</strong></p>
+""" + ORDER_ITEMS_TEMPLATE + """
+<p><strong>Total Amount:</strong> ${{ '%.2f' % order.total_amount }}</p>
+<p>You should receive your digital goods shortly. If you have any questions, please contact our support team.</p>
+<p>Thank you for your business!</p>
+""",
+    ),
+    'rejected': _compile(
+        "Order #{{ order.id }} Status Update - {{ order.status.title() }}",
+        """
+<h2>Order Update Required</h2>
+<p>Dear {{ order.user.username }},</p>
+<p>Unfortunately, your order #{{ order.id }} requires attention.</p>
+<p>Please check your payment confirmation and contact our support team if you need assistance.</p>
+<p><strong>Order Total:</strong> ${{ '%.2f' % order.total_amount }}</p>
+<p>Payment ID: {{ order.payment_id }}</p>
+""",
+    ),
+    'digest': _compile(
+        "Updates on {{ entries|length }} of your orders",
+        """
+<h2>Your Order Updates</h2>
+<p>Dear {{ user.username }},</p>
+<p>Here is a summary of recent activity on your orders.</p>
+{% for order, status_change, status in entries %}
+<h3>Order #{{ order.id }} - {% if not status_change %}Received{% elif status == 'accepted' %}Accepted{% else %}Requires Attention{% endif %}</h3>
+""" + ORDER_ITEMS_TEMPLATE + """
+<p><strong>Total Amount:</strong> ${{ '%.2f' % order.total_amount }} &middot; <strong>Payment ID:</strong> {{ order.payment_id }}</p>
+{% endfor %}
+<p>If you have any questions, please contact our support team.</p>
+""",
+    ),
+}
+
+def _write_email_log(f, from_email, to_email, subject, content):
+    f.write(f"\n{'='*50}\n")
+    f.write(f"Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+    f.write(f"From: {from_email}\n")
+    f.write(f"To: {to_email}\n")
+    f.write(f"Subject: {subject}\n")
+    f.write(f"Content:\n{content}\n")
+    f.write(f"{'='*50}\n")
+
+def send_emails(messages):
     """
-    Send email using local email logging (alternative to SendGrid)
+    Send a batch of (to_email, subject, html_content) messages with a single
+    settings lookup and a single log file write
     """
+    if not messages:
+        return 0
     try:
-        # Get sender email from settings or use default
         from_email = SiteSettings.get_setting('sender_email', 'noreply@marketplace.com')
         
-        # Create email content
-        content = html_content if html_content else text_content
-        if not content:
-            logger.error("No email content provided")
-            return False
-        
-        # Log email to file instead of sending (since SendGrid is not available)
-        email_log = {
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-            'from': from_email,
-            'to': to_email,
-            'subject': subject,
-            'content': content
-        }
+        # Log emails to file instead of sending (since SendGrid is not available)
+        os.makedirs(os.path.dirname(EMAIL_LOG_FILE), exist_ok=True)
+        with open(EMAIL_LOG_FILE, 'a', encoding='utf-8') as f:
+            for to_email, subject, content in messages:
+                _write_email_log(f, from_email, to_email, subject, content)
         
-        # Ensure logs directory exists
-        os.makedirs('logs', exist_ok=True)
-        
-        # Write to email log file
-        with open('logs/emails.log', 'a', encoding='utf-8') as f:
-            f.write(f"\n{'='*50}\n")
-            f.write(f"Time: {email_log['timestamp']}\n")
-            f.write(f"From: {email_log['from']}\n")
-            f.write(f"To: {email_log['to']}\n")
-            f.write(f"Subject: {email_log['subject']}\n")
-            f.write(f"Content:\n{email_log['content']}\n")
-            f.write(f"{'='*50}\n")
-        
-        logger.info(f"Email logged successfully to logs/emails.log for {to_email}")
-        return True
+        logger.info(f"{len(messages)} email(s) logged successfully to {EMAIL_LOG_FILE}")
+        return len(messages)
         
     except Exception as e:
         logger.error(f"Email logging error: {e}")
+        return 0
+
+def send_email(to_email, subject, text_content=None, html_content=None):
+    """
+    Send email using local email logging (alternative to SendGrid)
+    """
+    content = html_content if html_content else text_content
+    if not content:
+        logger.error("No email content provided")
         return False
+    return send_emails([(to_email, subject, content)]) == 1
+
+def load_orders_for_notification(order_ids):
+    """Load orders with their user, items and products in one query"""
+    stmt = select(Order).where(Order.id.in_(order_ids)).options(
+        joinedload(Order.user),
+        joinedload(Order.order_items).joinedload(OrderItem.product),
+    ).order_by(Order.id)
+    return db.session.scalars(stmt).unique().all()
+
+def notification_template(order, status_change=False):
+    if not status_change:
+        return 'confirmation'
+    if order.status in ('accepted', 'rejected'):
+        return order.status
+    return None
+
+def render_order_notification(order, status_change=False):
+    """
+    Render the notification for an order as (to_email, subject, html_content),
+    or None if the order's status has no notification
+    """
+    name = notification_template(order, status_change)
+    if name is None:
+        return None
+    subject, html = EMAIL_TEMPLATES[name]
+    return (order.user.email, subject.render(order=order), html.render(order=order))
+
+def render_order_notifications(orders, status_change=False):
+    """Render notifications for many eagerly loaded orders in one pass"""
+    messages = []
+    for order in orders:
+        message = render_order_notification(order, status_change)
+        if message:
+            messages.append(message)
+    return messages
+
+def send_order_notifications(order_ids, status_change=False):
+    """
+    Load, render and send notifications for many orders with a constant
+    number of queries. Returns the number of emails sent.
+    """
+    try:
+        orders = load_orders_for_notification(order_ids)
+        return send_emails(render_order_notifications(orders, status_change))
+    except Exception as e:
+        logger.error(f"Error sending order notifications: {e}")
+        return 0
 
 def send_order_notification(order, status_change=False):
     """
     Send order notification email to user
     """
+    return send_order_notifications([order.id], status_change) == 1
+
+def _digest_window():
     try:
-        if status_change:
-            subject = f"Order #{order.id} Status Update - {order.status.title()}"
-            if order.status == 'accepted':
-                html_content = f"""
-                <h2>Great News! Your Order Has Been Accepted</h2>
-                <p>Dear {order.user.username},</p>
-                <p>Your order #{order.id} has been accepted and is being processed.</p>
-                <p><strong>Order Details:</strong></p>
-                <ul>
-                """
-                for item in order.order_items:
-                    html_content += f"<li>{item.product.name} x {item.quantity} - ${item.price * item.quantity:.2f}"
-                    if item.custom_input_value:
-                        html_content += f" (Input: {item.custom_input_value})"
-                    html_content += "</li>"
-                
-                html_content += f"""
-                </ul>
-                <p><strong>Total Amount:</strong> ${order.total_amount:.2f}</p>
-                <p>You should receive your digital goods shortly. If you have any questions, please contact our support team.</p>
-                <p>Thank you for your business!</p>
-                """
-            elif order.status == 'rejected':
-                html_content = f"""
-                <h2>Order Update Required</h2>
-                <p>Dear {order.user.username},</p>
-                <p>Unfortunately, your order #{order.id} requires attention.</p>
-                <p>Please check your payment confirmation and contact our support team if you need assistance.</p>
-                <p><strong>Order Total:</strong> ${order.total_amount:.2f}</p>
-                <p>Payment ID: {order.payment_id}</p>
-                """
-        else:
-            subject = f"Order Confirmation #{order.id}"
-            html_content = f"""
-            <h2>Order Confirmation</h2>
-            <p>Dear {order.user.username},</p>
-            <p>Thank you for your order! We've received your payment confirmation and are reviewing it.</p>
-            <p><strong>Order #:</strong> {order.id}</p>
-            <p><strong>Order Details:</strong></p>
-            <ul>
-            """
-            for item in order.order_items:
-                html_content += f"<li>{item.product.name} x {item.quantity} - ${item.price * item.quantity:.2f}"
-                if item.custom_input_value:
-                    html_content += f" (Input: {item.custom_input_value})"
-                html_content += "</li>"
-            
-            html_content += f"""
-            </ul>
-            <p><strong>Total Amount:</strong> ${order.total_amount:.2f}</p>
-            <p><strong>Payment ID:</strong> {order.payment_id}</p>
-            <p>We'll review your payment confirmation and update you on the status soon.</p>
-            """
-        
-        return send_email(order.user.email, subject, html_content=html_content)
-        
+        return int(SiteSettings.get_setting('email_digest_window', '0') or 0)
+    except ValueError:
+        return 0
+
+def queue_order_notifications(order_ids, status_change=False):
+    """
+    Send order notifications, or queue them for a per-recipient digest when
+    the email_digest_window setting is non-zero. Queued digests are sent by
+    the background flusher or ``flask send-digests``, never on this request.
+    """
+    if not order_ids:
+        return
+    if _digest_window() <= 0:
+        send_order_notifications(order_ids, status_change)
+        return
+    try:
+        rows = db.session.execute(
+            select(Order.id, Order.status, User.email)
+            .join(Order.user).where(Order.id.in_(order_ids))
+        ).all()
+        for order_id, status, email in rows:
+            if status_change and status not in ('accepted', 'rejected'):
+                continue
+            db.session.add(PendingNotification(
+                recipient_email=email, order_id=order_id,
+                status_change=status_change, status=status,
+            ))
+        db.session.commit()
     except Exception as e:
-        logger.error(f"Error sending order notification: {e}")
-        return False
+        db.session.rollback()
+        logger.error(f"Error queueing order notifications: {e}")
+        send_order_notifications(order_ids, status_change)
+
+def render_digest(entries):
+    """
+    Render one email for a recipient's (order, status_change, status) entries.
+    A single entry is sent as the regular notification.
+    """
+    if len(entries) == 1:
+        order, status_change, _ = entries[0]
+        return render_order_notification(order, status_change)
+    subject, html = EMAIL_TEMPLATES['digest']
+    user = entries[0][0].user
+    return (user.email, subject.render(entries=entries), html.render(user=user, entries=entries))
+
+def flush_due_notifications(force=False):
+    """
+    Send one digest per recipient whose oldest queued notification is older
+    than the digest window (or every queued notification when ``force``).
+    Returns the number of emails sent.
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=0 if force else _digest_window())
+    due_recipients = db.session.scalars(
+        select(PendingNotification.recipient_email)
+        .group_by(PendingNotification.recipient_email)
+        .having(func.min(PendingNotification.created_at) <= cutoff)
+    ).all()
+    if not due_recipients:
+        return 0
+    
+    pending = db.session.scalars(
+        select(PendingNotification)
+        .where(PendingNotification.recipient_email.in_(due_recipients))
+        .order_by(PendingNotification.created_at, PendingNotification.id)
+    ).all()
+    
+    # Claim the rows; another worker flushing concurrently gets a short rowcount
+    claimed_ids = [p.id for p in pending]
+    result = db.session.execute(delete(PendingNotification).where(PendingNotification.id.in_(claimed_ids)))
+    if result.rowcount != len(claimed_ids):
+        db.session.rollback()
+        return 0
+    db.session.commit()
+    
+    orders = {o.id: o for o in load_orders_for_notification({p.order_id for p in pending})}
+    by_recipient = {}
+    for p in pending:
+        if p.order_id in orders:
+            by_recipient.setdefault(p.recipient_email, []).append((orders[p.order_id], p.status_change, p.status))
+    
+    messages = [message for message in map(render_digest, by_recipient.values()) if message]
+    return send_emails(messages)
+
+_flusher = None
+_flusher_lock = threading.Lock()
+
+def _flush_loop(app, interval):
+    while True:
+        time.sleep(interval)
+        with app.app_context():
+            try:
+                # With the window set back to 0 this drains anything still queued
+                flush_due_notifications()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Error flushing email digests: {e}")
+            finally:
+                db.session.remove()
+
+def start_digest_flusher(app):
+    """
+    Flush due digests every DIGEST_FLUSH_INTERVAL seconds on a background
+    thread of this worker; 0 leaves it to ``flask send-digests`` from cron
+    """
+    global _flusher
+    interval = app.config.get('DIGEST_FLUSH_INTERVAL', 0)
+    with _flusher_lock:
+        if interval <= 0 or _flusher is not None:
+            return
+        _flusher = threading.Thread(target=_flush_loop, args=(app, interval), name='digest-flusher', daemon=True)
+        _flusher.start()
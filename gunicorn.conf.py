@@ -0,0 +1,55 @@
+"""
+Gunicorn configuration.
+
+    gunicorn -c gunicorn.conf.py main:app
+
+The app is imported once in the master. The master then migrates the schema
+and warms templates and mappers before any worker is forked, so workers start
+from an already-warm copy-on-write image and never race each other on DDL.
+Each worker then opens its pool connections and fills its caches before it
+accepts traffic (see warmup.py and /healthz/ready). Workers are threaded
+(``GUNICORN_THREADS`` per worker, within the DB pool size) so the admin order
+stream does not tie up a worker for its whole lifetime.
+"""
+
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+# Threaded workers, so a long-lived /admin/orders/stream connection holds
+# one thread rather than a whole worker
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.environ.get("GUNICORN_THREADS", "8"))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1") == "1"
+reuse_port = True
+
+def when_ready(server):
+    from main import app
+    from app import db
+    from cli import bootstrap
+    from warmup import warm_up
+
+    if os.environ.get("AUTO_MIGRATE", "1") == "1":
+        bootstrap()
+    warm_up(app)
+
+    # Connections opened in the master must not be shared with the workers
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose()
+
+def post_fork(server, worker):
+    from app import app, db
+
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+def post_worker_init(worker):
+    # Runs before the worker accepts its first request
+    from main import app
+    from warmup import warm_up, warm_up_worker
+
+    if not preload_app:
+        warm_up(app)
+    warm_up_worker(app)
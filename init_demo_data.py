@@ -5,6 +5,7 @@ Initialize demo data for the digital goods marketplace
 
 from app import app, db
 from models import Section, Product, PaymentMethod, SiteSettings
+from catalog import reconcile_section_counts
 
 def init_demo_data():
     with app.app_context():
@@ -220,6 +221,9 @@ def init_demo_data():
         
         # Commit all changes
         db.session.commit()
+        
+        # Products were added through the ORM; fill the section counters
+        reconcile_section_counts()
         print("Demo data initialized successfully!")
         print("Created:")
         print(f"- {len(sections_data)} sections")
@@ -0,0 +1,146 @@
+"""
+Logging setup.
+
+``LOG_MODE=development`` (default) keeps plain DEBUG logging to stderr.
+``LOG_MODE=production`` routes every record through a QueueHandler to a
+QueueListener thread, so request threads never block on stream I/O, and
+writes one JSON object per line carrying the request id.
+
+Environment:
+    LOG_LEVEL    root level in production mode (default INFO)
+    LOG_LEVELS   per-logger levels, e.g. "sqlalchemy.engine=WARNING,utils=INFO"
+    LOG_SAMPLE   keep only a fraction of DEBUG/INFO records per logger,
+                 e.g. "utils=0.1,email_service=0.25"
+"""
+
+import os
+import sys
+import json
+import uuid
+import queue
+import atexit
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from flask import g, request, has_request_context
+
+DEFAULT_LEVELS = {
+    'sqlalchemy': 'WARNING',
+    'werkzeug': 'WARNING',
+    'PIL': 'WARNING',
+}
+
+def _parse_mapping(value):
+    mapping = {}
+    for part in (value or '').split(','):
+        if '=' in part:
+            name, setting = part.split('=', 1)
+            mapping[name.strip()] = setting.strip()
+    return mapping
+
+class RequestIdFilter(logging.Filter):
+    """Attach the current request id (or None outside a request)"""
+    def filter(self, record):
+        record.request_id = g.get('request_id') if has_request_context() else None
+        return True
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep a configured fraction of DEBUG/INFO records for noisy loggers.
+    Warnings and errors are never dropped.
+    """
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        name = record.name
+        while name:
+            if name in self.rates:
+                return random.random() < self.rates[name]
+            name = name.rpartition('.')[0]
+        return True
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+            'pid': record.process,
+        }
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+class ForkSafeQueueHandler(QueueHandler):
+    """
+    QueueHandler that owns its listener thread and restarts it in a forked
+    child (e.g. a gunicorn worker of a preloaded app), where the parent's
+    thread no longer exists
+    """
+    def __init__(self, *handlers):
+        super().__init__(None)
+        self.handlers = handlers
+        self._start()
+
+    def _start(self):
+        self.pid = os.getpid()
+        self.queue = queue.SimpleQueue()
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def prepare(self, record):
+        # Keep exceptions structured for the JSON formatter on the listener side
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def emit(self, record):
+        if self.pid != os.getpid():
+            self._start()
+        super().emit(record)
+
+def configure_logging(app):
+    mode = os.environ.get('LOG_MODE', 'development')
+    if mode != 'production':
+        logging.basicConfig(level=logging.DEBUG)
+        return
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = ForkSafeQueueHandler(stream_handler)
+    queue_handler.addFilter(RequestIdFilter())
+    rates = {name: float(rate) for name, rate in _parse_mapping(os.environ.get('LOG_SAMPLE')).items()}
+    queue_handler.addFilter(SamplingFilter(rates))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(os.environ.get('LOG_LEVEL', 'INFO').upper())
+
+    levels = dict(DEFAULT_LEVELS, **_parse_mapping(os.environ.get('LOG_LEVELS')))
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    @app.before_request
+    def assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+    @app.after_request
+    def expose_request_id(response):
+        if 'request_id' in g:
+            response.headers['X-Request-ID'] = g.request_id
+        return response
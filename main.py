@@ -1,5 +1,10 @@
 from app import app
 import routes
+import cli
 
 if __name__ == "__main__":
+    from warmup import warm_up, warm_up_worker
+    cli.bootstrap()
+    warm_up(app)
+    warm_up_worker(app)
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -3,6 +3,7 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
+from cache import bump_version
 
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -15,6 +16,12 @@ class User(UserMixin, db.Model):
     # Relationships
     orders = db.relationship('Order', backref='user', lazy=True)
     
+    __table_args__ = (
+        # Case-insensitive prefix search in the admin user list
+        db.Index('ix_user_username_lower', db.func.lower(username)),
+        db.Index('ix_user_email_lower', db.func.lower(email)),
+    )
+    
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
     
@@ -27,6 +34,10 @@ class Section(db.Model):
     description = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Denormalized from product; kept current by adjust_section_counts() in catalog.py
+    product_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    in_stock_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
     # Relationships
     products = db.relationship('Product', backref='section', lazy=True, cascade='all, delete-orphan')
 
@@ -43,10 +54,15 @@ class Product(db.Model):
     custom_input_required = db.Column(db.Boolean, default=False)
     admin_description = db.Column(db.Text)  # Description shown before add to cart
     section_id = db.Column(db.Integer, db.ForeignKey('section.id'), nullable=False)
+    sku = db.Column(db.String(100))  # External SKU used by bulk imports (see product_import.py)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     order_items = db.relationship('OrderItem', backref='product', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_product_section_sku', 'section_id', 'sku', unique=True),
+    )
 
 class PaymentMethod(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -63,7 +79,10 @@ class Order(db.Model):
     total_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')  # pending, accepted, rejected
     payment_id = db.Column(db.String(200), nullable=False)
+    payment_id_normalized = db.Column(db.String(200), index=True)  # see utils.normalize_payment_id
     payment_confirmation_filename = db.Column(db.String(200))
+    payment_image_hash = db.Column(db.String(16))  # dHash of the confirmation image
+    idempotency_key = db.Column(db.String(64), unique=True, index=True)  # checkout form token
     notes = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -71,6 +90,11 @@ class Order(db.Model):
     # Relationships
     order_items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
     payment_method = db.relationship('PaymentMethod', backref='orders', lazy=True)
+    
+    __table_args__ = (
+        # Keyset pagination of a customer's order history
+        db.Index('ix_order_user_created', 'user_id', 'created_at', 'id'),
+    )
 
 class OrderItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -80,6 +104,41 @@ class OrderItem(db.Model):
     price = db.Column(db.Float, nullable=False)
     custom_input_value = db.Column(db.String(500))  # User's input for custom fields
     
+class ArchivedOrder(db.Model):
+    """Settled order moved out of the hot order table (see archive.py)"""
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    payment_method_id = db.Column(db.Integer, db.ForeignKey('payment_method.id'), nullable=True)
+    total_amount = db.Column(db.Float, nullable=False)
+    status = db.Column(db.String(20))
+    payment_id = db.Column(db.String(200), nullable=False)
+    payment_id_normalized = db.Column(db.String(200), index=True)
+    payment_confirmation_filename = db.Column(db.String(200))
+    payment_image_hash = db.Column(db.String(16))
+    notes = db.Column(db.Text)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    # Relationships (same names as Order so templates can render either)
+    order_items = db.relationship('ArchivedOrderItem', backref='order', lazy=True)
+    user = db.relationship('User', lazy=True)
+    payment_method = db.relationship('PaymentMethod', lazy=True)
+    
+    __table_args__ = (
+        db.Index('ix_archived_order_user_created', 'user_id', 'created_at', 'id'),
+    )
+
+class ArchivedOrderItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('archived_order.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    custom_input_value = db.Column(db.String(500))
+    
+    product = db.relationship('Product', lazy=True)
+
 class SiteSettings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     key = db.Column(db.String(100), unique=True, nullable=False)
@@ -99,6 +158,37 @@ class SiteSettings(db.Model):
             setting = SiteSettings(key=key, value=value)
             db.session.add(setting)
         db.session.commit()
+        bump_version('settings')
+
+class PendingNotification(db.Model):
+    """Order notification waiting to be coalesced into a digest email"""
+    id = db.Column(db.Integer, primary_key=True)
+    recipient_email = db.Column(db.String(120), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), nullable=False)
+    status_change = db.Column(db.Boolean, default=False)
+    status = db.Column(db.String(20))  # order status when the notification was queued
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_pending_notification_recipient_created', 'recipient_email', 'created_at'),
+    )
+
+class PaymentHashBand(db.Model):
+    """
+    One 16-bit slice of an order's payment image hash. Hashes within three
+    bits of each other share at least one slice, so near duplicates are
+    found with an indexed equality lookup (see payment_checks.py).
+    Not tied to the order row, so it survives archival.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False, index=True)
+    band = db.Column(db.SmallInteger, nullable=False)
+    value = db.Column(db.Integer, nullable=False)
+    image_hash = db.Column(db.String(16), nullable=False)
+    
+    __table_args__ = (
+        db.Index('ix_payment_hash_band_value', 'band', 'value'),
+    )
 
 # Cart session handling
 class CartItem:
@@ -0,0 +1,142 @@
+"""
+Live order feed for the admin order list.
+
+Every write path that creates or changes orders calls ``orders_changed()``,
+which bumps the 'orders' cache version (a file mtime, see cache.py). The
+``/admin/orders/stream`` Server-Sent Events endpoint checks that version once
+per poll interval and only queries the database when it has moved, sending
+just the orders whose ``updated_at`` is past the client's cursor.
+
+A stream occupies one gunicorn thread (gthread workers, see gunicorn.conf.py)
+while it is open, and is capped at ``ORDER_FEED_MAX_SECONDS`` so it never
+outlives the worker timeout. The browser's EventSource reconnects on its own and
+resumes from the ``Last-Event-ID`` it last received.
+"""
+
+import json
+import time
+import logging
+from datetime import timedelta
+from sqlalchemy import select, tuple_
+from sqlalchemy.orm import joinedload
+from app import db
+from cache import get_version, bump_version
+from models import Order
+from utils import encode_cursor, decode_cursor
+
+logger = logging.getLogger(__name__)
+
+ORDERS_VERSION = 'orders'
+
+# Commits are not ordered by updated_at, so each query looks back a little
+# past the cursor and skips rows that were already sent
+OVERLAP = timedelta(seconds=5)
+
+def orders_changed():
+    bump_version(ORDERS_VERSION)
+
+def order_event(order):
+    return {
+        'id': order.id,
+        'status': order.status,
+        'username': order.user.username if order.user else None,
+        'payment_method': order.payment_method.name if order.payment_method else None,
+        'payment_id': order.payment_id,
+        'total_amount': order.total_amount,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'updated_at': order.updated_at.isoformat() if order.updated_at else None,
+    }
+
+def _latest_cursor():
+    latest = db.session.execute(
+        select(Order.updated_at, Order.id).order_by(Order.updated_at.desc(), Order.id.desc()).limit(1)
+    ).first()
+    return (latest.updated_at, latest.id) if latest else None
+
+def _seen_behind(cursor):
+    """Order versions in the overlap window at or behind the cursor, which the client already has"""
+    if cursor is None:
+        return {}
+    rows = db.session.execute(
+        select(Order.id, Order.updated_at)
+        .where(Order.updated_at >= cursor[0] - OVERLAP, tuple_(Order.updated_at, Order.id) <= tuple_(*cursor))
+    )
+    return {order_id: updated_at for order_id, updated_at in rows}
+
+def _changed_orders(cursor, limit):
+    """
+    Return ``(late, forward)``: orders committed late within the overlap
+    window behind the cursor, and the next batch of orders past it
+    """
+    query = select(Order).options(
+        joinedload(Order.user),
+        joinedload(Order.payment_method),
+    ).order_by(Order.updated_at, Order.id)
+    if cursor is None:
+        return [], db.session.scalars(query.limit(limit)).all()
+    
+    position = tuple_(Order.updated_at, Order.id)
+    late = db.session.scalars(
+        query.where(Order.updated_at >= cursor[0] - OVERLAP, position <= tuple_(*cursor))
+    ).all()
+    forward = db.session.scalars(query.where(position > tuple_(*cursor)).limit(limit)).all()
+    return late, forward
+
+def order_stream(last_event_id, poll_interval, max_seconds, batch_size=100):
+    """
+    Yield SSE messages for orders created or changed after ``last_event_id``
+    (an encode_cursor() of updated_at and id). Without one the stream starts
+    at the newest order, so only later changes are sent.
+    """
+    cursor = decode_cursor(last_event_id)
+    try:
+        if cursor is None:
+            cursor = _latest_cursor()
+        # order id -> updated_at of the version already sent; rows behind the
+        # starting cursor count as sent, so only late commits after this
+        # point are picked up by the overlap query
+        sent = _seen_behind(cursor)
+    finally:
+        db.session.remove()
+    
+    version = None
+    deadline = time.monotonic() + max_seconds
+    last_write = time.monotonic()
+    
+    yield f"retry: {int(poll_interval * 1000)}\n\n"
+    
+    while time.monotonic() < deadline:
+        current = get_version(ORDERS_VERSION)
+        if current != version:
+            version = current
+            try:
+                late, forward = _changed_orders(cursor, batch_size)
+                events = []
+                for order in late:
+                    if sent.get(order.id) != order.updated_at:
+                        sent[order.id] = order.updated_at
+                        events.append((encode_cursor(*cursor), order_event(order)))
+                for order in forward:
+                    cursor = (order.updated_at, order.id)
+                    sent[order.id] = order.updated_at
+                    events.append((encode_cursor(*cursor), order_event(order)))
+                if len(forward) == batch_size:
+                    # More rows waiting; query again without waiting for a bump
+                    version = None
+            finally:
+                # Do not hold a pool connection while idle
+                db.session.remove()
+    
+            if cursor:
+                horizon = cursor[0] - OVERLAP
+                sent = {order_id: updated for order_id, updated in sent.items() if updated >= horizon}
+    
+            for event_id, payload in events:
+                yield f"id: {event_id}\nevent: order\ndata: {json.dumps(payload)}\n\n"
+                last_write = time.monotonic()
+    
+        if time.monotonic() - last_write >= 15:
+            # Comment line keeps proxies from closing an idle connection
+            yield ": keep-alive\n\n"
+            last_write = time.monotonic()
+        time.sleep(poll_interval)
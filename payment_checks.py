@@ -0,0 +1,135 @@
+"""
+Duplicate payment detection.
+
+Every order stores its payment ID normalized (``utils.normalize_payment_id``)
+in an indexed column, and a 64-bit dHash of its confirmation image split into
+four 16-bit bands in ``payment_hash_band``. Two hashes within
+``PAYMENT_HASH_MAX_DISTANCE`` (at most 3) bits of each other must agree on at
+least one band, so candidates come from indexed equality lookups and only
+those few rows are compared bit by bit.
+
+``duplicate_flags()`` answers for a whole page of orders with one query per
+table, so the admin order list can show the flags without a query per row.
+"""
+
+import os
+import logging
+from flask import current_app
+from sqlalchemy import select, delete, tuple_
+from app import db
+from models import Order, ArchivedOrder, PaymentHashBand
+from utils import normalize_payment_id, image_dhash
+
+logger = logging.getLogger(__name__)
+
+BANDS = 4
+BAND_BITS = 16
+
+# Bands only guarantee a shared slice for hashes this close
+MAX_DISTANCE_LIMIT = BANDS - 1
+
+def hash_bands(image_hash):
+    value = int(image_hash, 16)
+    return [(band, (value >> (band * BAND_BITS)) & 0xFFFF) for band in range(BANDS)]
+
+def hamming(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+def record_payment_hash(order):
+    """Index an order's payment image hash; call inside the creating transaction"""
+    if not order.payment_image_hash:
+        return
+    db.session.add_all(
+        PaymentHashBand(order_id=order.id, band=band, value=value, image_hash=order.payment_image_hash)
+        for band, value in hash_bands(order.payment_image_hash)
+    )
+
+def _max_distance():
+    return min(current_app.config.get('PAYMENT_HASH_MAX_DISTANCE', 3), MAX_DISTANCE_LIMIT)
+
+def duplicate_flags(orders, chunk_size=500):
+    """
+    Map each order id to the other orders (hot or archived) that share its
+    normalized payment ID or have a near-identical payment image
+    """
+    result = {}
+    for start in range(0, len(orders), chunk_size):
+        result.update(_duplicate_flags(orders[start:start + chunk_size]))
+    return result
+
+def _duplicate_flags(orders):
+    flags = {order.id: {'payment_id': set(), 'image': set()} for order in orders}
+    
+    by_payment_id = {}
+    for order in orders:
+        if order.payment_id_normalized:
+            by_payment_id.setdefault(order.payment_id_normalized, []).append(order.id)
+    if by_payment_id:
+        for model in (Order, ArchivedOrder):
+            rows = db.session.execute(
+                select(model.id, model.payment_id_normalized)
+                .where(model.payment_id_normalized.in_(list(by_payment_id)))
+            )
+            for other_id, normalized in rows:
+                for order_id in by_payment_id[normalized]:
+                    if other_id != order_id:
+                        flags[order_id]['payment_id'].add(other_id)
+    
+    by_band = {}
+    for order in orders:
+        if order.payment_image_hash:
+            for key in hash_bands(order.payment_image_hash):
+                by_band.setdefault(key, []).append(order)
+    if by_band:
+        max_distance = _max_distance()
+        rows = db.session.execute(
+            select(PaymentHashBand.order_id, PaymentHashBand.band, PaymentHashBand.value, PaymentHashBand.image_hash)
+            .where(tuple_(PaymentHashBand.band, PaymentHashBand.value).in_(list(by_band)))
+        )
+        for other_id, band, value, other_hash in rows:
+            for order in by_band[(band, value)]:
+                if other_id != order.id and hamming(order.payment_image_hash, other_hash) <= max_distance:
+                    flags[order.id]['image'].add(other_id)
+    
+    return {
+        order_id: {kind: sorted(ids) for kind, ids in found.items() if ids}
+        for order_id, found in flags.items()
+        if found['payment_id'] or found['image']
+    }
+
+def check_new_order(order):
+    """Log a warning when a just-created order looks like a reused payment"""
+    found = duplicate_flags([order]).get(order.id)
+    if found:
+        logger.warning(f"Order #{order.id} may reuse a payment: {found}")
+    return found
+
+def backfill_payment_hashes(upload_folder, batch_size=500):
+    """
+    Fill the normalized payment ID and image hash for orders created before
+    they were recorded; returns the number of orders updated
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        orders = db.session.scalars(
+            select(Order).where(Order.id > last_id, Order.payment_id_normalized.is_(None))
+            .order_by(Order.id).limit(batch_size)
+        ).all()
+        if not orders:
+            break
+        for order in orders:
+            order.payment_id_normalized = normalize_payment_id(order.payment_id)
+            if order.payment_confirmation_filename and not order.payment_image_hash:
+                path = os.path.join(upload_folder, order.payment_confirmation_filename)
+                try:
+                    order.payment_image_hash = image_dhash(path)
+                except Exception as e:
+                    logger.warning(f"Could not hash payment image of order #{order.id}: {e}")
+                    continue
+                db.session.execute(delete(PaymentHashBand).where(PaymentHashBand.order_id == order.id))
+                record_payment_hash(order)
+        db.session.commit()
+        updated += len(orders)
+        last_id = orders[-1].id
+    return updated
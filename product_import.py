@@ -0,0 +1,328 @@
+"""
+Bulk product import from CSV or JSON Lines.
+
+Rows are read from the stream one at a time and upserted in batches keyed by
+section and external ``sku``: each batch costs one lookup, a bulk INSERT
+and a bulk UPDATE instead of a commit per product. A row that fails
+validation is reported with its line number and skipped; the rest of the
+file is still imported.
+
+Recognised fields: ``sku`` (required), ``section`` (name, created if
+missing) or ``section_id``, ``name``, ``description``, ``price``,
+``quantity``, ``is_featured``, ``custom_input_label``,
+``custom_input_placeholder``, ``custom_input_required``,
+``admin_description`` and ``image``. New products need at least a name and
+a price; for existing products only the fields present are changed.
+
+``image`` is an http(s) URL or a path inside the import image folder. Images
+are resized on a background thread pool after the rows are committed, so a
+large import is not held up by image processing.
+
+    flask --app main import-products products.csv --images ./images
+"""
+
+import io
+import csv
+import math
+import json
+import logging
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, wait
+from sqlalchemy import select, insert, update, tuple_
+from werkzeug.security import safe_join
+from app import db
+from models import Product, Section
+from catalog import adjust_section_counts, catalog_changed
+from utils import save_product_image, delete_file
+
+logger = logging.getLogger(__name__)
+
+TEXT_FIELDS = ('name', 'description', 'custom_input_label', 'custom_input_placeholder', 'admin_description')
+BOOLEAN_FIELDS = ('is_featured', 'custom_input_required')
+MAX_REPORTED_ERRORS = 1000
+
+# Bounded columns are checked per row so one long value cannot fail a batch
+MAX_LENGTHS = {
+    field: Product.__table__.c[field].type.length
+    for field in ('sku', 'name', 'custom_input_label', 'custom_input_placeholder')
+}
+SECTION_NAME_LENGTH = Section.__table__.c.name.type.length
+
+_image_executor = None
+_image_futures = set()
+_image_lock = threading.Lock()
+
+class RowError(ValueError):
+    pass
+
+def _read_rows(stream, fmt):
+    """Yield ``(line_number, row_dict)`` from a binary stream"""
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'jsonl':
+        for line_number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, RowError(f"invalid JSON: {e}")
+                continue
+            yield line_number, row if isinstance(row, dict) else RowError("expected a JSON object")
+    else:
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+
+def _parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in ('1', 'true', 'yes', 'y'):
+        return True
+    if value in ('0', 'false', 'no', 'n', ''):
+        return False
+    raise RowError(f"invalid boolean '{value}'")
+
+def _check_length(field, value, limit):
+    if len(value) > limit:
+        raise RowError(f"{field} is longer than {limit} characters")
+
+def _parse_row(row):
+    """Validate a raw row into ``(section_key, sku, values, image)``"""
+    row = {k.strip().lower(): v for k, v in row.items() if k and v is not None and str(v).strip() != ''}
+    
+    sku = str(row.get('sku', '')).strip()
+    if not sku:
+        raise RowError("sku is required")
+    _check_length('sku', sku, MAX_LENGTHS['sku'])
+    
+    if 'section_id' in row:
+        try:
+            section_key = int(row['section_id'])
+        except (TypeError, ValueError, OverflowError):
+            raise RowError(f"invalid section_id '{row['section_id']}'")
+    elif 'section' in row:
+        section_key = str(row['section']).strip()
+        _check_length('section', section_key, SECTION_NAME_LENGTH)
+    else:
+        raise RowError("section or section_id is required")
+    
+    values = {field: str(row[field]).strip() for field in TEXT_FIELDS if field in row}
+    for field, limit in MAX_LENGTHS.items():
+        if field in values:
+            _check_length(field, values[field], limit)
+    if 'price' in row:
+        try:
+            values['price'] = float(row['price'])
+        except (TypeError, ValueError):
+            raise RowError(f"invalid price '{row['price']}'")
+        if not math.isfinite(values['price']):
+            raise RowError(f"invalid price '{row['price']}'")
+        if values['price'] < 0:
+            raise RowError("price cannot be negative")
+    if 'quantity' in row:
+        try:
+            # int() of an infinite JSON number raises OverflowError
+            values['quantity'] = int(row['quantity'])
+        except (TypeError, ValueError, OverflowError):
+            raise RowError(f"invalid quantity '{row['quantity']}'")
+        if values['quantity'] < 0:
+            raise RowError("quantity cannot be negative")
+    for field in BOOLEAN_FIELDS:
+        if field in row:
+            values[field] = _parse_bool(row[field])
+    
+    image = str(row['image']).strip() if 'image' in row else None
+    return section_key, sku, values, image
+
+class ProductImporter:
+    """Accumulates parsed rows and writes them a batch at a time"""
+    
+    def __init__(self, app, batch_size=500, image_folder=None):
+        self.app = app
+        self.batch_size = batch_size
+        self.image_folder = image_folder
+        self.created = 0
+        self.updated = 0
+        self.images_queued = 0
+        self.errors = []
+        self.error_count = 0
+        self._batch = {}
+        self._sections = {name: section_id for section_id, name in db.session.execute(
+            select(Section.id, Section.name)).all()}
+        self._section_ids = set(self._sections.values())
+    
+    def error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+    
+    def _section_id(self, key):
+        if isinstance(key, int):
+            if key not in self._section_ids:
+                raise RowError(f"section {key} does not exist")
+            return key
+        if key not in self._sections:
+            section = Section(name=key)
+            db.session.add(section)
+            db.session.commit()
+            self._sections[key] = section.id
+            self._section_ids.add(section.id)
+            logger.info(f"Created section '{key}' during product import")
+        return self._sections[key]
+    
+    def add(self, line_number, row):
+        try:
+            if isinstance(row, RowError):
+                raise row
+            section_key, sku, values, image = _parse_row(row)
+            if image and not image.startswith(('http://', 'https://')) and not self.image_folder:
+                raise RowError("local image paths need an import image folder")
+            section_id = self._section_id(section_key)
+        except RowError as e:
+            self.error(line_number, str(e))
+            return
+    
+        # A SKU repeated within a batch: later fields override earlier ones
+        key = (section_id, sku)
+        if key in self._batch:
+            _, pending, pending_image = self._batch[key]
+            values = {**pending, **values}
+            image = image or pending_image
+        self._batch[key] = (line_number, values, image)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+    
+    def flush(self):
+        if not self._batch:
+            return
+        batch, self._batch = self._batch, {}
+    
+        existing = {
+            (row.section_id, row.sku): row for row in db.session.execute(
+                select(Product.id, Product.section_id, Product.sku, Product.quantity, Product.image_filename)
+                .where(tuple_(Product.section_id, Product.sku).in_(list(batch)))
+            )
+        }
+    
+        inserts, updates, images = [], [], []
+        deltas = {}  # section_id -> [products, in_stock]
+        for (section_id, sku), (line_number, values, image) in batch.items():
+            current = existing.get((section_id, sku))
+            delta = deltas.setdefault(section_id, [0, 0])
+            if current is None:
+                if 'name' not in values or 'price' not in values:
+                    self.error(line_number, "new products need a name and a price")
+                    continue
+                values = {'description': '', 'quantity': 0, **values, 'section_id': section_id, 'sku': sku}
+                inserts.append(values)
+                delta[0] += 1
+                delta[1] += values['quantity'] > 0
+            else:
+                if 'quantity' in values:
+                    delta[1] += (values['quantity'] > 0) - (current.quantity > 0)
+                if values:
+                    updates.append({**values, 'id': current.id})
+            if image:
+                images.append((section_id, sku, image, current.image_filename if current else None))
+    
+        try:
+            if inserts:
+                db.session.execute(insert(Product), inserts)
+            if updates:
+                # Bulk UPDATE by primary key, executemany per set of columns
+                db.session.execute(update(Product), updates)
+            for section_id, (products, in_stock) in deltas.items():
+                adjust_section_counts(section_id, products=products, in_stock=in_stock)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Product import batch failed: {e}")
+            for line_number, _, _ in batch.values():
+                self.error(line_number, f"batch failed: {e}")
+            return
+    
+        self.created += len(inserts)
+        self.updated += len(updates)
+        for job in images:
+            queue_image(self.app, *job, image_folder=self.image_folder)
+            self.images_queued += 1
+    
+    def summary(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'images_queued': self.images_queued,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+def import_products(app, stream, fmt='csv', batch_size=500, image_folder=None):
+    """Import products from a binary CSV or JSONL stream; returns a summary dict"""
+    importer = ProductImporter(app, batch_size=batch_size, image_folder=image_folder)
+    for line_number, row in _read_rows(stream, fmt):
+        importer.add(line_number, row)
+    importer.flush()
+    
+    if importer.created or importer.updated:
+        catalog_changed()
+    logger.info(f"Product import: {importer.created} created, {importer.updated} updated, "
+                f"{importer.error_count} errors, {importer.images_queued} images queued")
+    return importer.summary()
+
+def _open_image(source, image_folder, max_bytes):
+    if source.startswith(('http://', 'https://')):
+        with urllib.request.urlopen(source, timeout=30) as response:
+            data = response.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            raise ValueError(f"image is larger than {max_bytes} bytes")
+        return io.BytesIO(data)
+    path = safe_join(image_folder, source)
+    if path is None:
+        raise ValueError("image path is outside the import image folder")
+    return path
+
+def _process_image(app, section_id, sku, source, old_filename, image_folder):
+    with app.app_context():
+        upload_folder = app.config['PRODUCT_UPLOAD_FOLDER']
+        try:
+            image = _open_image(source, image_folder, app.config['MAX_CONTENT_LENGTH'])
+        except Exception as e:
+            logger.warning(f"Import image for {sku} not loaded from {source}: {e}")
+            return
+        filename = save_product_image(image, upload_folder)
+        if not filename:
+            return
+        try:
+            db.session.execute(
+                update(Product).where(Product.section_id == section_id, Product.sku == sku)
+                .values(image_filename=filename),
+                execution_options={'synchronize_session': False}
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            delete_file(filename, upload_folder)
+            logger.error(f"Could not attach import image to {sku}: {e}")
+            return
+        finally:
+            db.session.remove()
+        if old_filename and old_filename != filename:
+            delete_file(old_filename, upload_folder)
+        catalog_changed()
+
+def queue_image(app, section_id, sku, source, old_filename=None, image_folder=None):
+    """Resize and attach a product image on the background pool"""
+    global _image_executor
+    with _image_lock:
+        if _image_executor is None:
+            _image_executor = ThreadPoolExecutor(
+                max_workers=app.config.get('IMPORT_IMAGE_WORKERS', 2), thread_name_prefix='import-image')
+        future = _image_executor.submit(_process_image, app, section_id, sku, source, old_filename, image_folder)
+        _image_futures.add(future)
+    future.add_done_callback(_image_futures.discard)
+
+def wait_for_images():
+    """Block until every queued image has been processed"""
+    wait(list(_image_futures))
@@ -0,0 +1,186 @@
+"""
+On-demand request profiling.
+
+A request is profiled when a signed-in admin sends ``X-Profile: 1`` (or adds
+``?_profile=1``), or at random with probability ``PROFILE_SAMPLE_RATE`` for
+background profiling of real traffic. While it runs, a sampler thread reads
+the request thread's stack every ``PROFILE_INTERVAL`` seconds and every SQL
+statement executed on that thread is recorded with its duration. Bound
+parameters are kept only in profiles an admin requested, since sampled
+profiles capture other users' requests.
+
+Each profile is written to ``instance/profiles`` as two files sharing a name:
+``.folded`` holds collapsed stacks (one ``frame;frame;frame count`` line per
+stack, ready for flamegraph.pl or speedscope) and ``.json`` holds the request
+details and its SQL. ``/admin/profiles`` lists and downloads them.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from flask import current_app, request, g
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+PROFILE_FOLDER = 'profiles'
+
+# Profiles being recorded, by the thread that serves the request
+_active = {}
+
+class Sampler:
+    """Samples one thread's stack on a background thread"""
+    
+    def __init__(self, thread_id, interval, record_parameters=False):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.record_parameters = record_parameters
+        self.stacks = Counter()
+        self.queries = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+    
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if threading.get_ident() in _active:
+        conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    sampler = _active.get(threading.get_ident())
+    starts = conn.info.get('profile_query_start')
+    if sampler is None or not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    query = {'statement': statement, 'ms': round(elapsed * 1000, 3)}
+    if sampler.record_parameters:
+        query['parameters'] = repr(parameters)[:500]
+    sampler.queries.append(query)
+
+def _should_profile():
+    rate = current_app.config.get('PROFILE_SAMPLE_RATE', 0)
+    if rate and random.random() < rate:
+        return 'sampled'
+    requested = request.headers.get('X-Profile') == '1' or request.args.get('_profile') == '1'
+    if requested and current_user.is_authenticated and current_user.is_admin:
+        return 'requested'
+    return None
+
+def profile_folder():
+    return os.path.join(current_app.instance_path, PROFILE_FOLDER)
+
+def _save(sampler, trigger, status_code):
+    folder = profile_folder()
+    os.makedirs(folder, exist_ok=True)
+    slug = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-') or 'root'
+    name = f"{datetime.utcnow():%Y%m%dT%H%M%S%f}_{request.method}_{slug[:60]}_{os.getpid()}"
+    
+    with open(os.path.join(folder, f"{name}.folded"), 'w', encoding='utf-8') as f:
+        for stack, count in sampler.stacks.most_common():
+            f.write(f"{stack} {count}\n")
+    with open(os.path.join(folder, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            'method': request.method,
+            'path': request.full_path,
+            'status': status_code,
+            'trigger': trigger,
+            'duration_ms': round(sampler.duration * 1000, 3),
+            'samples': sum(sampler.stacks.values()),
+            'interval_ms': sampler.interval * 1000,
+            'sql_ms': round(sum(q['ms'] for q in sampler.queries), 3),
+            'queries': sampler.queries,
+        }, f, indent=2)
+    
+    # Keep only the newest profiles
+    keep = current_app.config.get('PROFILE_KEEP', 200)
+    names = sorted({os.path.splitext(n)[0] for n in os.listdir(folder)}, reverse=True)
+    for old in names[keep:]:
+        for ext in ('.folded', '.json'):
+            try:
+                os.remove(os.path.join(folder, old + ext))
+            except FileNotFoundError:
+                pass
+    logger.info(f"Saved profile {name} ({sampler.duration * 1000:.0f} ms, {len(sampler.queries)} queries)")
+
+def list_profiles():
+    """Summaries of the stored profiles, newest first"""
+    folder = profile_folder()
+    if not os.path.isdir(folder):
+        return []
+    profiles = []
+    for filename in sorted(os.listdir(folder), reverse=True):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(folder, filename), encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read profile {filename}: {e}")
+            continue
+        data.pop('queries', None)
+        data['name'] = filename[:-len('.json')]
+        profiles.append(data)
+    return profiles
+
+def init_profiler(app):
+    @app.before_request
+    def start_profile():
+        trigger = _should_profile()
+        if trigger:
+            # Bound values can hold user data; keep them only when an admin asked
+            sampler = Sampler(threading.get_ident(), app.config.get('PROFILE_INTERVAL', 0.005),
+                              record_parameters=trigger == 'requested')
+            g.profile = (sampler, trigger)
+            _active[sampler.thread_id] = sampler
+            sampler.start()
+    
+    @app.after_request
+    def stop_profile(response):
+        profile = g.pop('profile', None)
+        if profile:
+            sampler, trigger = profile
+            _active.pop(sampler.thread_id, None)
+            sampler.stop()
+            try:
+                _save(sampler, trigger, response.status_code)
+            except OSError as e:
+                logger.error(f"Could not save profile: {e}")
+        return response
+    
+    @app.teardown_request
+    def discard_profile(exc):
+        # Requests that failed before after_request still stop their sampler
+        profile = g.pop('profile', None)
+        if profile:
+            _active.pop(profile[0].thread_id, None)
+            profile[0].stop()
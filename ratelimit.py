@@ -0,0 +1,126 @@
+"""
+Token-bucket rate limiting for expensive POST endpoints.
+
+Bucket state lives in a small SQLite file (``RATE_LIMIT_STORAGE``, by default
+in the instance folder), so every gunicorn worker on the host draws from the
+same buckets. Each bucket is refilled continuously at ``capacity / period``
+tokens per second; a request that finds no token is rejected with 429 before
+the view runs.
+
+Limits are configured per route name as ``"capacity/period_seconds"``, e.g.
+``RATE_LIMIT_LOGIN=10/60`` in the environment.
+"""
+
+import os
+import time
+import random
+import sqlite3
+import logging
+import threading
+from functools import wraps
+from flask import current_app, request, abort
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    'login': '10/60',
+    'register': '5/3600',
+    'checkout': '10/600',
+}
+
+def parse_limit(value):
+    capacity, period = value.split('/', 1)
+    return int(capacity), float(period)
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file, one connection per thread and process"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=OFF')
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def consume(self, key, capacity, period):
+        """
+        Take one token from the bucket. Returns 0 if the request is allowed,
+        otherwise the number of seconds until a token is available.
+        """
+        conn = self._connection()
+        rate = capacity / period
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated FROM bucket WHERE key = ?', (key,)).fetchone()
+            tokens = capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                         (key, tokens, now))
+            if random.random() < 0.001:
+                # Drop buckets idle for a day; they would be full again anyway
+                conn.execute('DELETE FROM bucket WHERE updated < ?', (now - 86400,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return 0 if allowed else (1 - tokens) / rate
+
+def _store():
+    store = current_app.extensions.get('rate_limit_store')
+    if store is None:
+        path = current_app.config.get('RATE_LIMIT_STORAGE') or \
+            os.path.join(current_app.instance_path, 'ratelimit.sqlite3')
+        store = current_app.extensions['rate_limit_store'] = SQLiteBucketStore(path)
+    return store
+
+def rate_limit(name, username_field=None):
+    """
+    Limit POSTs to a view per client IP, per signed-in user and, for login
+    style forms, per submitted username
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'POST' or not current_app.config.get('RATE_LIMIT_ENABLED', True):
+                return view(*args, **kwargs)
+
+            limit = current_app.config.get('RATE_LIMITS', {}).get(name, DEFAULT_LIMITS.get(name))
+            if not limit:
+                return view(*args, **kwargs)
+            capacity, period = parse_limit(limit)
+
+            keys = [f"{name}:ip:{request.remote_addr}"]
+            if current_user.is_authenticated:
+                keys.append(f"{name}:user:{current_user.id}")
+            if username_field:
+                username = request.form.get(username_field, '').strip().lower()
+                if username:
+                    keys.append(f"{name}:username:{username}")
+
+            try:
+                retry_after = max(_store().consume(key, capacity, period) for key in keys)
+            except sqlite3.Error as e:
+                # Never lock users out because the limiter itself is unavailable
+                logger.error(f"Rate limiter unavailable: {e}")
+                retry_after = 0
+
+            if retry_after:
+                logger.warning(f"Rate limit '{name}' exceeded by {request.remote_addr}")
+                abort(429, retry_after=int(retry_after) + 1)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
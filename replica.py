@@ -0,0 +1,111 @@
+"""
+Read-replica routing.
+
+Set ``REPLICA_DATABASE_URL`` to send read-only views (catalog, landing page,
+admin order list and dashboard) to a replica; everything else, and every
+request made shortly after the same visitor wrote something, stays on the
+primary. Without the variable all reads use ``db.session`` as before.
+
+To try it locally with two SQLite files:
+
+    export DATABASE_URL=sqlite:////tmp/primary.db
+    export REPLICA_DATABASE_URL=sqlite:////tmp/replica.db
+    flask --app main migrate && cp /tmp/primary.db /tmp/replica.db
+"""
+
+import time
+import logging
+from flask import current_app, g, session, has_request_context
+from flask.globals import app_ctx
+from sqlalchemy import event, text
+from sqlalchemy.orm import scoped_session, sessionmaker
+from app import db
+from db_profiles import engine_options
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = 'replica'
+LAST_WRITE_KEY = '_last_write'
+
+# Per-worker replica health, refreshed at most every REPLICA_CHECK_INTERVAL seconds
+_health = {'checked_at': 0.0, 'healthy': False}
+
+def init_replica(app):
+    url = app.config.get('REPLICA_DATABASE_URL')
+    if not url:
+        return
+    app.config.setdefault('SQLALCHEMY_BINDS', {})[REPLICA_BIND] = dict(engine_options(url, REPLICA_BIND), url=url)
+    app.extensions['replica_session'] = None
+
+    @app.teardown_appcontext
+    def remove_replica_session(exc):
+        sessions = app.extensions.get('replica_session')
+        if sessions is not None:
+            sessions.remove()
+
+def _scoped_session():
+    app = current_app._get_current_object()
+    sessions = app.extensions['replica_session']
+    if sessions is None:
+        factory = sessionmaker(bind=db.engines[REPLICA_BIND])
+        sessions = scoped_session(factory, scopefunc=lambda: id(app_ctx._get_current_object()))
+        app.extensions['replica_session'] = sessions
+    return sessions
+
+@event.listens_for(db.session, 'after_flush')
+def _remember_write(session_, flush_context):
+    """Pin the visitor to the primary for a while after any write"""
+    if has_request_context():
+        g.wrote_to_primary = True
+        session[LAST_WRITE_KEY] = time.time()
+
+def replica_lag(connection):
+    """Seconds the replica is behind the primary (0 where it cannot be measured)"""
+    if connection.dialect.name != 'postgresql':
+        return 0.0
+    lag = connection.execute(text(
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )).scalar()
+    return float(lag or 0)
+
+def replica_healthy():
+    """Lag guard: the replica is used only while it is reachable and within REPLICA_MAX_LAG"""
+    now = time.monotonic()
+    if now - _health['checked_at'] < current_app.config['REPLICA_CHECK_INTERVAL']:
+        return _health['healthy']
+    _health['checked_at'] = now
+    try:
+        with db.engines[REPLICA_BIND].connect() as connection:
+            lag = replica_lag(connection)
+        _health['healthy'] = lag <= current_app.config['REPLICA_MAX_LAG']
+        if not _health['healthy']:
+            logger.warning(f"Replica is {lag:.1f}s behind, reading from primary")
+    except Exception as e:
+        _health['healthy'] = False
+        logger.error(f"Replica unavailable, reading from primary: {e}")
+    return _health['healthy']
+
+def use_replica():
+    if 'replica_session' not in current_app.extensions:
+        return False
+    if has_request_context():
+        if g.get('wrote_to_primary'):
+            return False
+        last_write = session.get(LAST_WRITE_KEY)
+        if last_write and time.time() - last_write < current_app.config['REPLICA_READ_YOUR_WRITES']:
+            return False
+    return replica_healthy()
+
+def read_session():
+    """Session for read-only queries: the replica when it can be used, else db.session"""
+    if use_replica():
+        return _scoped_session()
+    return db.session
+
+def fetch_all(stmt):
+    """
+    Run a read-only ORM select and return the list of entities, on the
+    read replica when one is configured and fresh
+    """
+    return read_session().scalars(stmt).unique().all()
@@ -1,17 +1,33 @@
 import os
-from flask import render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
+import uuid
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, abort, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash
+from sqlalchemy import select, func, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
 from app import app, db
-from models import User, Product, Section, PaymentMethod, Order, OrderItem, SiteSettings
-from utils import save_uploaded_file, delete_file, calculate_cart_total
-from email_service import send_order_notification
+from models import User, Product, Section, PaymentMethod, Order, OrderItem, SiteSettings, ArchivedOrder
+from utils import save_uploaded_file, delete_file, calculate_cart_total, encode_cursor, decode_cursor, normalize_payment_id, image_dhash
+from email_service import queue_order_notifications
+from cache import cache_anonymous_page
+from replica import read_session, fetch_all
+from db_profiles import pool_metrics
+from ratelimit import rate_limit
+from catalog import featured_products, active_payment_methods, catalog_changed, payment_methods_changed, adjust_section_counts, suggestion_index
+from warmup import check_ready
+from archive import order_history_page, user_order_stats
+from order_feed import order_stream, orders_changed
+from profiler import list_profiles, profile_folder
+from product_import import import_products
+from payment_checks import record_payment_hash, check_new_order, duplicate_flags
 import logging
 
 logger = logging.getLogger(__name__)
 
 # Auth routes
 @app.route('/register', methods=['GET', 'POST'])
+@rate_limit('register', username_field='username')
 def register():
     if request.method == 'POST':
         username = request.form['username']
@@ -45,6 +61,7 @@ def register():
     return render_template('register.html')
 
 @app.route('/login', methods=['GET', 'POST'])
+@rate_limit('login', username_field='username')
 def login():
     if request.method == 'POST':
         username = request.form['username']
@@ -71,16 +88,15 @@ def logout():
 
 # Main routes
 @app.route('/')
+@cache_anonymous_page('settings')
 def index():
     if current_user.is_authenticated:
-        featured_products = Product.query.filter_by(is_featured=True).all()
-        payment_methods = PaymentMethod.query.filter_by(is_active=True).all()
         site_description = SiteSettings.get_setting('site_description', 
             'Welcome to our Digital Goods Marketplace - Your trusted source for game codes, digital currencies, and more!')
         
         return render_template('index.html', 
-                             featured_products=featured_products,
-                             payment_methods=payment_methods,
+                             featured_products=featured_products(),
+                             payment_methods=active_payment_methods(),
                              site_description=site_description)
     else:
         # Show landing page for non-authenticated users
@@ -94,14 +110,18 @@ def index():
 @app.route('/products')
 @login_required
 def products():
-    sections = Section.query.all()
+    sections = fetch_all(select(Section))
     selected_section = request.args.get('section', type=int)
     
     if selected_section:
-        products_list = Product.query.filter_by(section_id=selected_section).all()
-        section_name = Section.query.get(selected_section).name
+        section = next((s for s in sections if s.id == selected_section), None)
+        if section is None:
+            abort(404)
+        products_list = fetch_all(select(Product).filter_by(section_id=selected_section)
+                                  .options(joinedload(Product.section)))
+        section_name = section.name
     else:
-        products_list = Product.query.all()
+        products_list = fetch_all(select(Product).options(joinedload(Product.section)))
         section_name = "All Products"
     
     return render_template('products.html', 
@@ -110,6 +130,21 @@ def products():
                          selected_section=selected_section,
                          section_name=section_name)
 
+@app.route('/api/suggest')
+@login_required
+def api_suggest():
+    """
+    Autocomplete for product and section names, served from the per-worker
+    index without a database query
+    """
+    query = request.args.get('q', '')[:100]
+    limit = min(request.args.get('limit', 10, type=int), 25)
+    response = jsonify({'q': query, 'suggestions': suggestion_index().search(query, limit)})
+    # The catalog is only visible to signed-in users, so no shared caches
+    response.cache_control.private = True
+    response.cache_control.max_age = 30
+    return response
+
 @app.route('/add_to_cart/<int:product_id>', methods=['POST'])
 @login_required
 def add_to_cart(product_id):
@@ -158,8 +193,10 @@ def cart():
     total = 0
     
     if 'cart' in session:
+        product_ids = {item['product_id'] for item in session['cart']}
+        products_by_id = {p.id: p for p in fetch_all(select(Product).where(Product.id.in_(product_ids)))}
         for item in session['cart']:
-            product = Product.query.get(item['product_id'])
+            product = products_by_id.get(item['product_id'])
             if product:
                 cart_item = {
                     'product': product,
@@ -176,17 +213,140 @@ def cart():
 @app.route('/remove_from_cart/<int:product_id>')
 @login_required
 def remove_from_cart(product_id):
+    # Links that predate custom_input remove every line for the product
+    custom_input_value = request.args.get('custom_input')
     if 'cart' in session:
         cart = session['cart']
-        session['cart'] = [item for item in cart if item['product_id'] != product_id]
+        session['cart'] = [item for item in cart if not _is_cart_line(item, product_id, custom_input_value)]
         session.modified = True
         flash('Item removed from cart', 'info')
     
     return redirect(url_for('cart'))
 
+# JSON cart API: each call changes one line and returns it with the totals,
+# so the page can update in place instead of reloading
+
+def _is_cart_line(item, product_id, custom_input_value):
+    return item['product_id'] == product_id and \
+        (custom_input_value is None or item['custom_input_value'] == custom_input_value)
+
+def _cart_line_json(item, product=None):
+    line = {
+        'product_id': item['product_id'],
+        'custom_input_value': item['custom_input_value'],
+        'quantity': item['quantity'],
+        'price': item['price'],
+        'subtotal': item['price'] * item['quantity'],
+    }
+    if product is not None:
+        line['name'] = product.name
+        line['stock'] = product.quantity
+    return line
+
+def _cart_json(cart, line=None):
+    return jsonify({
+        'line': line,
+        'cart': {
+            'lines': len(cart),
+            'items': sum(item['quantity'] for item in cart),
+            'total': calculate_cart_total(cart),
+        },
+    })
+
+@app.route('/api/cart/<int:product_id>', methods=['POST', 'PATCH', 'DELETE'])
+@login_required
+def api_cart_line(product_id):
+    """
+    POST adds to a line, PATCH sets its quantity (0 removes it) and DELETE
+    removes it. Lines are identified by product and custom input.
+    """
+    data = request.get_json(silent=True)
+    if data is None:
+        data = request.form
+    elif not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    custom_input_value = str(data.get('custom_input', '') or '')
+    cart = session.get('cart', [])
+    line = next((item for item in cart if _is_cart_line(item, product_id, custom_input_value)), None)
+    
+    if request.method == 'DELETE':
+        if line is None:
+            return jsonify({'error': 'Item is not in your cart'}), 404
+        cart.remove(line)
+        session['cart'] = cart
+        session.modified = True
+        return _cart_json(cart)
+    
+    try:
+        quantity = int(data.get('quantity', 1))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid quantity'}), 400
+    if quantity < 0 or (request.method == 'POST' and quantity == 0):
+        return jsonify({'error': 'Invalid quantity'}), 400
+    
+    if request.method == 'PATCH':
+        if line is None:
+            return jsonify({'error': 'Item is not in your cart'}), 404
+        if quantity == 0:
+            cart.remove(line)
+            session['cart'] = cart
+            session.modified = True
+            return _cart_json(cart)
+    
+    product = db.session.get(Product, product_id)
+    if product is None:
+        return jsonify({'error': 'Product not found'}), 404
+    if request.method == 'POST' and product.custom_input_required and not custom_input_value.strip():
+        return jsonify({'error': f'{product.custom_input_label} is required for this product'}), 400
+    
+    new_quantity = quantity if request.method == 'PATCH' else quantity + (line['quantity'] if line else 0)
+    if new_quantity > product.quantity:
+        return jsonify({'error': 'Not enough stock available', 'stock': product.quantity}), 409
+    
+    if line is None:
+        line = {
+            'product_id': product_id,
+            'quantity': 0,
+            'custom_input_value': custom_input_value,
+            'price': product.price
+        }
+        cart.append(line)
+    line['quantity'] = new_quantity
+    
+    session['cart'] = cart
+    session.modified = True
+    return _cart_json(cart, _cart_line_json(line, product))
+
+def _order_for_checkout_token(token):
+    if not token:
+        return None
+    return db.session.scalar(
+        select(Order).where(Order.idempotency_key == token[:64], Order.user_id == current_user.id)
+    )
+
+def _checkout_replayed(order):
+    # The cart was turned into this order, same as on the success path
+    session.pop('cart', None)
+    session.modified = True
+    flash(f'Order #{order.id} was already placed.', 'info')
+    return redirect(url_for('index'))
+
 @app.route('/checkout', methods=['GET', 'POST'])
 @login_required
+@rate_limit('checkout')
 def checkout():
+    # Idempotency key rendered into the form; a repeated POST with the same
+    # key (double click, browser retry) gets the order it already created.
+    # It may also be passed in the form action's query string, which lets a
+    # retry be answered without parsing the upload.
+    checkout_token = request.args.get('checkout_token')
+    if request.method == 'POST':
+        checkout_token = checkout_token or request.form.get('checkout_token')
+        existing = _order_for_checkout_token(checkout_token)
+        if existing:
+            return _checkout_replayed(existing)
+    checkout_token = checkout_token or uuid.uuid4().hex
+    
     if 'cart' not in session or not session['cart']:
         flash('Your cart is empty', 'error')
         return redirect(url_for('products'))
@@ -207,7 +367,7 @@ def checkout():
             cart_items.append(cart_item)
             total += cart_item['subtotal']
     
-    payment_methods = PaymentMethod.query.filter_by(is_active=True).all()
+    payment_methods = active_payment_methods()
     
     if request.method == 'POST':
         payment_method_id = request.form.get('payment_method_id')
@@ -217,21 +377,27 @@ def checkout():
         # Validate inputs
         if not payment_method_id:
             flash('Please select a payment method', 'error')
-            return render_template('checkout.html', cart_items=cart_items, total=total, payment_methods=payment_methods)
+            return render_template('checkout.html', cart_items=cart_items, total=total, payment_methods=payment_methods, checkout_token=checkout_token)
         
         if not payment_id:
             flash('Payment ID is required', 'error')
-            return render_template('checkout.html', cart_items=cart_items, total=total, payment_methods=payment_methods)
+            return render_template('checkout.html', cart_items=cart_items, total=total, payment_methods=payment_methods, checkout_token=checkout_token)
         
         if not payment_confirmation or payment_confirmation.filename == '':
             flash('Payment confirmation image is required', 'error')
-            return render_template('checkout.html', cart_items=cart_items, total=total, payment_methods=payment_methods)
+            return render_template('checkout.html', cart_items=cart_items, total=total, payment_methods=payment_methods, checkout_token=checkout_token)
         
         # Save payment confirmation image
         confirmation_filename = save_uploaded_file(payment_confirmation, app.config['PAYMENT_UPLOAD_FOLDER'])
         if not confirmation_filename:
             flash('Invalid payment confirmation image', 'error')
-            return render_template('checkout.html', cart_items=cart_items, total=total, payment_methods=payment_methods)
+            return render_template('checkout.html', cart_items=cart_items, total=total, payment_methods=payment_methods, checkout_token=checkout_token)
+        
+        try:
+            image_hash = image_dhash(os.path.join(app.config['PAYMENT_UPLOAD_FOLDER'], confirmation_filename))
+        except Exception as e:
+            logger.warning(f"Could not hash payment image {confirmation_filename}: {e}")
+            image_hash = None
         
         # Create order
         order = Order(
@@ -239,13 +405,28 @@ def checkout():
             payment_method_id=int(payment_method_id),
             total_amount=total,
             payment_id=payment_id,
+            payment_id_normalized=normalize_payment_id(payment_id),
             payment_confirmation_filename=confirmation_filename,
+            payment_image_hash=image_hash,
+            idempotency_key=checkout_token[:64],
             status='pending'
         )
         db.session.add(order)
-        db.session.flush()  # Get the order ID
+        try:
+            db.session.flush()  # Get the order ID
+        except IntegrityError:
+            # A concurrent submission with the same key won the race
+            db.session.rollback()
+            delete_file(confirmation_filename, app.config['PAYMENT_UPLOAD_FOLDER'])
+            existing = _order_for_checkout_token(checkout_token)
+            if existing is None:
+                raise
+            return _checkout_replayed(existing)
+        record_payment_hash(order)
+        check_new_order(order)
         
         # Add order items
+        sold_out = False
         for item in cart_items:
             order_item = OrderItem(
                 order_id=order.id,
@@ -257,12 +438,20 @@ def checkout():
             db.session.add(order_item)
             
             # Update product quantity
-            item['product'].quantity -= item['quantity']
+            product = item['product']
+            was_in_stock = product.quantity > 0
+            product.quantity -= item['quantity']
+            if was_in_stock and product.quantity <= 0:
+                adjust_section_counts(product.section_id, in_stock=-1)
+                sold_out = True
         
         db.session.commit()
+        orders_changed()
+        if sold_out:
+            catalog_changed()
         
         # Send order confirmation email
-        send_order_notification(order)
+        queue_order_notifications([order.id])
         
         # Clear cart
         session.pop('cart', None)
@@ -271,7 +460,33 @@ def checkout():
         flash(f'Order #{order.id} placed successfully! You will receive an email confirmation.', 'success')
         return redirect(url_for('index'))
     
-    return render_template('checkout.html', cart_items=cart_items, total=total, payment_methods=payment_methods)
+    return render_template('checkout.html', cart_items=cart_items, total=total, payment_methods=payment_methods, checkout_token=checkout_token)
+
+@app.route('/my/orders')
+@login_required
+def my_orders():
+    per_page = 20
+    cursor = decode_cursor(request.args.get('before'))
+    
+    # Includes archived orders (see archive.py)
+    orders = order_history_page(current_user.id, cursor, limit=per_page + 1)
+    next_cursor = None
+    if len(orders) > per_page:
+        orders = orders[:per_page]
+        next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
+    
+    return render_template('my_orders.html', orders=orders, next_cursor=next_cursor)
+
+# Health checks for the load balancer
+@app.route('/healthz/live')
+def healthz_live():
+    return jsonify({'status': 'ok'})
+
+@app.route('/healthz/ready')
+def healthz_ready():
+    if not check_ready(app):
+        return jsonify({'status': 'not ready'}), 503
+    return jsonify({'status': 'ready'})
 
 # File serving routes
 @app.route('/uploads/products/<filename>')
@@ -296,13 +511,15 @@ def admin_dashboard():
         return redirect(url_for('index'))
     
     # Calculate statistics
-    total_products = Product.query.count()
-    total_sections = Section.query.count()
-    total_users = User.query.count()
-    pending_orders = Order.query.filter_by(status='pending').count()
-    total_profit = db.session.query(db.func.sum(Order.total_amount)).filter_by(status='accepted').scalar() or 0
+    reads = read_session()
+    total_products = reads.query(Product).count()
+    total_sections = reads.query(Section).count()
+    total_users = reads.query(User).count()
+    pending_orders = reads.query(Order).filter_by(status='pending').count()
+    total_profit = (reads.query(db.func.sum(Order.total_amount)).filter_by(status='accepted').scalar() or 0) + \
+        (reads.query(db.func.sum(ArchivedOrder.total_amount)).filter_by(status='accepted').scalar() or 0)
     
-    recent_orders = Order.query.order_by(Order.created_at.desc()).limit(5).all()
+    recent_orders = reads.query(Order).order_by(Order.created_at.desc()).limit(5).all()
     
     return render_template('admin/dashboard.html',
                          total_products=total_products,
@@ -354,7 +571,9 @@ def admin_products():
             image_filename=image_filename
         )
         db.session.add(product)
+        adjust_section_counts(section_id, products=1, in_stock=1 if quantity > 0 else 0)
         db.session.commit()
+        catalog_changed()
         
         flash('Product added successfully', 'success')
         return redirect(url_for('admin_products'))
@@ -363,6 +582,26 @@ def admin_products():
     sections = Section.query.all()
     return render_template('admin/products.html', products=products, sections=sections)
 
+@app.route('/admin/products/import', methods=['POST'])
+@login_required
+def admin_import_products():
+    if not current_user.is_admin:
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    
+    upload = request.files.get('file')
+    if not upload or upload.filename == '':
+        return jsonify({'error': 'No file uploaded'}), 400
+    
+    fmt = request.form.get('format') or ('jsonl' if upload.filename.lower().endswith(('.jsonl', '.ndjson')) else 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': f'Unsupported format {fmt}'}), 400
+    
+    summary = import_products(app, upload.stream, fmt,
+                              batch_size=app.config['IMPORT_BATCH_SIZE'],
+                              image_folder=app.config['IMPORT_IMAGE_FOLDER'])
+    return jsonify(summary)
+
 @app.route('/admin/products/delete/<int:product_id>')
 @login_required
 def admin_delete_product(product_id):
@@ -377,7 +616,9 @@ def admin_delete_product(product_id):
         delete_file(product.image_filename, app.config['PRODUCT_UPLOAD_FOLDER'])
     
     db.session.delete(product)
+    adjust_section_counts(product.section_id, products=-1, in_stock=-1 if product.quantity > 0 else 0)
     db.session.commit()
+    catalog_changed()
     
     flash('Product deleted successfully', 'success')
     return redirect(url_for('admin_products'))
@@ -396,6 +637,7 @@ def admin_sections():
         section = Section(name=name, description=description)
         db.session.add(section)
         db.session.commit()
+        catalog_changed()
         
         flash('Section added successfully', 'success')
         return redirect(url_for('admin_sections'))
@@ -419,6 +661,7 @@ def admin_delete_section(section_id):
     
     db.session.delete(section)
     db.session.commit()
+    catalog_changed()
     
     flash('Section and all its products deleted successfully', 'success')
     return redirect(url_for('admin_sections'))
@@ -432,12 +675,37 @@ def admin_orders():
     
     status_filter = request.args.get('status', 'all')
     
-    if status_filter == 'all':
-        orders = Order.query.order_by(Order.created_at.desc()).all()
-    else:
-        orders = Order.query.filter_by(status=status_filter).order_by(Order.created_at.desc()).all()
+    query = select(Order).options(
+        joinedload(Order.user),
+        joinedload(Order.payment_method),
+        selectinload(Order.order_items).joinedload(OrderItem.product),
+    ).order_by(Order.created_at.desc())
+    if status_filter != 'all':
+        query = query.filter_by(status=status_filter)
+    orders = fetch_all(query)
     
-    return render_template('admin/orders.html', orders=orders, status_filter=status_filter)
+    # Orders sharing a payment ID or a near-identical payment screenshot
+    duplicates = duplicate_flags(orders)
+    
+    return render_template('admin/orders.html', orders=orders, status_filter=status_filter, duplicates=duplicates)
+
+@app.route('/admin/orders/stream')
+@login_required
+def admin_orders_stream():
+    """Server-Sent Events feed of new and changed orders (see order_feed.py)"""
+    if not current_user.is_admin:
+        abort(403)
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    stream = order_stream(
+        last_event_id,
+        poll_interval=app.config['ORDER_FEED_POLL_INTERVAL'],
+        max_seconds=app.config['ORDER_FEED_MAX_SECONDS'],
+    )
+    response = Response(stream_with_context(stream), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # let nginx pass events through unbuffered
+    return response
 
 @app.route('/admin/orders/update/<int:order_id>/<status>')
 @login_required
@@ -454,12 +722,48 @@ def admin_update_order(order_id, status):
     old_status = order.status
     order.status = status
     db.session.commit()
+    orders_changed()
     
     # Send status update email if status changed
     if old_status != status:
-        send_order_notification(order, status_change=True)
+        queue_order_notifications([order.id], status_change=True)
     
     flash(f'Order #{order_id} status updated to {status}', 'success')
+    if status == 'accepted':
+        found = duplicate_flags([order]).get(order.id)
+        if found:
+            others = sorted(set(found.get('payment_id', [])) | set(found.get('image', [])))
+            flash(f'Order #{order_id} may reuse the payment of order(s) {", ".join(f"#{i}" for i in others)}', 'warning')
+    return redirect(url_for('admin_orders'))
+
+@app.route('/admin/orders/bulk_update', methods=['POST'])
+@login_required
+def admin_bulk_update_orders():
+    if not current_user.is_admin:
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    
+    status = request.form.get('status')
+    order_ids = [int(order_id) for order_id in request.form.getlist('order_ids') if order_id.isdigit()]
+    
+    if status not in ['pending', 'accepted', 'rejected']:
+        flash('Invalid status', 'error')
+        return redirect(url_for('admin_orders'))
+    
+    # Only orders whose status actually changes get an email
+    changed_ids = db.session.scalars(
+        select(Order.id).where(Order.id.in_(order_ids), Order.status != status)
+    ).all()
+    if changed_ids:
+        db.session.execute(
+            db.update(Order).where(Order.id.in_(changed_ids)).values(status=status),
+            execution_options={'synchronize_session': False}
+        )
+        db.session.commit()
+        orders_changed()
+        queue_order_notifications(changed_ids, status_change=True)
+    
+    flash(f'{len(changed_ids)} order(s) updated to {status}', 'success')
     return redirect(url_for('admin_orders'))
 
 @app.route('/admin/payment_methods', methods=['GET', 'POST'])
@@ -483,6 +787,7 @@ def admin_payment_methods():
         )
         db.session.add(payment_method)
         db.session.commit()
+        payment_methods_changed()
         
         flash('Payment method added successfully', 'success')
         return redirect(url_for('admin_payment_methods'))
@@ -500,6 +805,7 @@ def admin_delete_payment_method(method_id):
     payment_method = PaymentMethod.query.get_or_404(method_id)
     db.session.delete(payment_method)
     db.session.commit()
+    payment_methods_changed()
     
     flash('Payment method deleted successfully', 'success')
     return redirect(url_for('admin_payment_methods'))
@@ -511,8 +817,38 @@ def admin_users():
         flash('Access denied', 'error')
         return redirect(url_for('index'))
     
-    users = User.query.all()
-    return render_template('admin/users.html', users=users)
+    per_page = 50
+    page = max(request.args.get('page', 1, type=int), 1)
+    search = request.args.get('q', '').strip().lower()
+    
+    query = select(User).order_by(User.id)
+    if search:
+        # Prefix range scans served by the lower(username) / lower(email) indexes
+        upper = search + '\uffff'
+        query = query.where(or_(
+            and_(func.lower(User.username) >= search, func.lower(User.username) < upper),
+            and_(func.lower(User.email) >= search, func.lower(User.email) < upper),
+        ))
+    users = fetch_all(query.limit(per_page + 1).offset((page - 1) * per_page))
+    has_next = len(users) > per_page
+    users = users[:per_page]
+    
+    # Order count, total spend and last order date for the whole page in one
+    # grouped query over the hot and archived orders
+    user_stats = {}
+    if users:
+        user_stats = {
+            user_id: {'order_count': count, 'total_spent': total, 'last_order_at': last}
+            for user_id, (count, total, last) in user_order_stats([u.id for u in users]).items()
+        }
+    empty_stats = {'order_count': 0, 'total_spent': 0, 'last_order_at': None}
+    
+    return render_template('admin/users.html',
+                         users=users,
+                         user_stats={u.id: user_stats.get(u.id, empty_stats) for u in users},
+                         page=page,
+                         has_next=has_next,
+                         search=search)
 
 @app.route('/admin/settings', methods=['GET', 'POST'])
 @login_required
@@ -528,18 +864,54 @@ def admin_settings():
         SiteSettings.set_setting('site_description', site_description)
         SiteSettings.set_setting('sender_email', sender_email)
         
+        email_digest_window = request.form.get('email_digest_window', '').strip()
+        if email_digest_window:
+            if not email_digest_window.isdigit():
+                flash('Email digest window must be a number of seconds', 'error')
+                return redirect(url_for('admin_settings'))
+            SiteSettings.set_setting('email_digest_window', email_digest_window)
+        
         flash('Settings updated successfully', 'success')
         return redirect(url_for('admin_settings'))
     
     site_description = SiteSettings.get_setting('site_description', 
         'Welcome to our Digital Goods Marketplace - Your trusted source for game codes, digital currencies, and more!')
     sender_email = SiteSettings.get_setting('sender_email', 'noreply@marketplace.com')
+    email_digest_window = SiteSettings.get_setting('email_digest_window', '0')
     
-    users = User.query.all()
     return render_template('admin/settings.html', 
                          site_description=site_description,
                          sender_email=sender_email,
-                         users=users)
+                         email_digest_window=email_digest_window)
+
+@app.route('/admin/metrics')
+@login_required
+def admin_metrics():
+    if not current_user.is_admin:
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    
+    return jsonify({'pid': os.getpid(), 'pools': pool_metrics(db.engines)})
+
+@app.route('/admin/profiles')
+@login_required
+def admin_profiles():
+    if not current_user.is_admin:
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    
+    return render_template('admin/profiles.html', profiles=list_profiles())
+
+@app.route('/admin/profiles/<filename>')
+@login_required
+def admin_download_profile(filename):
+    if not current_user.is_admin:
+        flash('Access denied', 'error')
+        return redirect(url_for('index'))
+    
+    if not filename.endswith(('.folded', '.json')):
+        abort(404)
+    return send_from_directory(profile_folder(), filename, as_attachment=True)
 
 @app.route('/admin/emails')
 @login_required
@@ -1,8 +1,10 @@
 import os
+import re
 import uuid
 from werkzeug.utils import secure_filename
 from PIL import Image
 import logging
+from datetime import datetime
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +14,23 @@ def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def image_dhash(source):
+    """
+    64-bit difference hash of an image as 16 hex digits. Re-encoded, resized
+    or lightly edited copies of the same picture differ in only a few bits.
+    """
+    with Image.open(source) as img:
+        pixels = list(img.convert('L').resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+def normalize_payment_id(payment_id):
+    """Payment ID as compared for duplicates: case, spaces and separators ignored"""
+    return re.sub(r'[\s\-_.:/#]+', '', payment_id or '').lower()
+
 def save_uploaded_file(file, upload_folder, max_size=(800, 600)):
     """
     Save uploaded file with unique filename and optional resizing
@@ -25,6 +44,7 @@ def save_uploaded_file(file, upload_folder, max_size=(800, 600)):
         name, ext = os.path.splitext(filename)
         unique_filename = f"{uuid.uuid4().hex}{ext}"
         filepath = os.path.join(upload_folder, unique_filename)
+        os.makedirs(upload_folder, exist_ok=True)
         
         # Save the file
         file.save(filepath)
@@ -45,6 +65,26 @@ def save_uploaded_file(file, upload_folder, max_size=(800, 600)):
         logger.error(f"Error saving file: {e}")
         return None
 
+def save_product_image(source, upload_folder, max_size=(800, 600)):
+    """
+    Resize an image from a path or binary stream into the product upload
+    folder under a unique filename; returns the filename or None
+    """
+    try:
+        with Image.open(source) as img:
+            ext = (img.format or 'png').lower()
+            if ext not in ALLOWED_EXTENSIONS:
+                logger.warning(f"Unsupported image format: {img.format}")
+                return None
+            unique_filename = f"{uuid.uuid4().hex}.{ext}"
+            os.makedirs(upload_folder, exist_ok=True)
+            img.thumbnail(max_size, Image.Resampling.LANCZOS)
+            img.save(os.path.join(upload_folder, unique_filename), optimize=True, quality=85)
+        return unique_filename
+    except Exception as e:
+        logger.error(f"Error processing image: {e}")
+        return None
+
 def delete_file(filename, upload_folder):
     """
     Delete file from upload folder
@@ -60,6 +100,18 @@ def delete_file(filename, upload_folder):
         logger.error(f"Error deleting file {filename}: {e}")
     return False
 
+def encode_cursor(created_at, row_id):
+    """Encode a (created_at, id) keyset pagination position"""
+    return f"{created_at.isoformat()}_{row_id}"
+
+def decode_cursor(cursor):
+    """Decode a cursor from encode_cursor(), or return None if it is malformed"""
+    try:
+        created_at, row_id = cursor.rsplit('_', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
 def format_currency(amount):
     """Format currency for display"""
     return f"${amount:.2f}"
@@ -0,0 +1,146 @@
+"""
+Worker warm-up and readiness.
+
+``warm_up()`` does the work that can be shared copy-on-write: it compiles
+every template (through an on-disk Jinja bytecode cache, so restarts skip
+parsing too) and configures the SQLAlchemy mappers. It is safe to run in the
+gunicorn master before forking.
+
+``warm_up_worker()`` runs in each worker before it serves traffic: it opens
+pool connections, fills the hot caches and starts the digest email flusher,
+then marks the worker ready. ``/healthz/ready`` reports 503 until then, and
+afterwards whenever the database stops answering. If the warm-up failed,
+each probe retries it.
+"""
+
+import os
+import logging
+import threading
+import time
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import text
+from sqlalchemy.orm import configure_mappers
+
+logger = logging.getLogger(__name__)
+
+_ready = threading.Event()
+_warm_up_done = threading.Event()
+_retry_lock = threading.Lock()
+
+def _configure_template_cache(app):
+    folder = os.path.join(app.instance_path, 'jinja_cache')
+    try:
+        os.makedirs(folder, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(folder)
+    except OSError as e:
+        logger.warning(f"Jinja bytecode cache disabled: {e}")
+
+def warm_up(app):
+    """
+    Pay the first-request costs up front: compile every template and
+    configure the SQLAlchemy mappers
+    """
+    start = time.perf_counter()
+    _configure_template_cache(app)
+
+    templates = 0
+    for name in app.jinja_env.list_templates():
+        try:
+            app.jinja_env.get_template(name)
+            templates += 1
+        except Exception as e:
+            logger.warning(f"Could not compile template {name}: {e}")
+
+    import models  # noqa: F401
+    configure_mappers()
+
+    logger.info(f"Warm-up finished in {(time.perf_counter() - start) * 1000:.0f} ms ({templates} templates)")
+
+def _open_connections(app):
+    from app import db
+
+    ok = True
+    with app.app_context():
+        for bind, engine in db.engines.items():
+            connections = []
+            try:
+                for _ in range(app.config.get('DB_WARM_CONNECTIONS', 2)):
+                    connection = engine.connect()
+                    connection.execute(text('SELECT 1'))
+                    connections.append(connection)
+            except Exception as e:
+                logger.warning(f"Could not pre-open connections for {bind or 'default'}: {e}")
+                ok = False
+            finally:
+                for connection in connections:
+                    connection.close()
+    return ok
+
+def _preload_caches(app):
+    from app import db
+    from catalog import featured_products, active_payment_methods, suggestion_index
+
+    with app.app_context():
+        try:
+            featured_products()
+            active_payment_methods()
+            suggestion_index()
+            return True
+        except Exception as e:
+            logger.warning(f"Could not preload caches: {e}")
+            return False
+        finally:
+            db.session.remove()
+
+def warm_up_worker(app):
+    """
+    Open pool connections, fill the hot caches and start background jobs.
+    The worker is reported ready only if the connections and caches loaded.
+    """
+    from email_service import start_digest_flusher
+
+    start = time.perf_counter()
+    ok = _open_connections(app) and _preload_caches(app)
+
+    # Render the landing page once so the anonymous page cache is primed
+    if ok:
+        try:
+            app.test_client().get('/')
+        except Exception as e:
+            logger.warning(f"Could not prime the landing page: {e}")
+
+    start_digest_flusher(app)
+
+    _warm_up_done.set()
+    if ok:
+        _ready.set()
+        logger.info(f"Worker {os.getpid()} ready in {(time.perf_counter() - start) * 1000:.0f} ms")
+    else:
+        logger.error(f"Worker {os.getpid()} warm-up failed; /healthz/ready retries it")
+
+def check_ready(app):
+    """
+    Whether this worker can serve traffic. After a failed warm-up each probe
+    retries the connection and cache steps; a ready worker re-checks that
+    its database still answers.
+    """
+    from app import db
+
+    if not _ready.is_set():
+        # Still warming up, or another probe is already retrying
+        if not _warm_up_done.is_set() or not _retry_lock.acquire(blocking=False):
+            return False
+        try:
+            if _open_connections(app) and _preload_caches(app):
+                _ready.set()
+                logger.info(f"Worker {os.getpid()} ready after retrying warm-up")
+        finally:
+            _retry_lock.release()
+        return _ready.is_set()
+
+    try:
+        db.session.execute(text('SELECT 1'))
+        return True
+    except Exception as e:
+        logger.warning(f"Readiness check failed: {e}")
+        return False